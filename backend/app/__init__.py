@@ -3,11 +3,24 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from config import Config
 
-app = Flask(__name__)
 version_blueprint = Blueprint('/v1', __name__)
+db = SQLAlchemy()
+migrate = Migrate()
 
-app.config.from_object(Config)
-db = SQLAlchemy(app)
-migrate = Migrate(app, db)
-from app import routes, models
+def create_app(config=Config):
+    """Build a configured app. Imaging libraries are only imported once a frame is rendered."""
+    app = Flask(__name__)
+    app.config.from_object(config)
+    db.init_app(app)
+    migrate.init_app(app, db)
 
+    from app import routes, models, commands
+    models.init_app(app)
+    routes.init_app(app)
+    commands.init_app(app)
+    app.register_blueprint(version_blueprint, url_prefix='/v1')
+
+    if app.config['METRICS_ENABLED']:
+        from app import metrics
+        metrics.init_app(app)
+    return app
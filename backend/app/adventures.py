@@ -0,0 +1,21 @@
+from datetime import datetime
+
+from app import db
+from app.models import Event, Goober, GooberHistory, event_catalog
+
+def run_adventures(now: datetime = None):
+    """Send every goober that is due on an adventure, in one bulk insert. Returns how many went."""
+    now = now or datetime.now()
+    # events are created by the web workers, whose invalidate() doesn't reach this process
+    event_catalog.check_version(Event.get_catalog_version())
+    goober_ids = Goober.get_due_for_adventure(now)
+    history = []
+    for goober_id in goober_ids:
+        event_id = Event.get_random_event_id()
+        if event_id is None:
+            break
+        history.append({'goober_id': goober_id, 'event_id': event_id, 'timestamp': now})
+    if history:
+        GooberHistory.create_many(history)
+    db.session.commit()
+    return len(history)
@@ -0,0 +1,107 @@
+"""Asyncio server for the read-heavy display endpoints, GET /v1/sessions and GET /v1/goobers.
+
+Slow displays read their frames a few bytes at a time, and under gunicorn each one holds a
+worker thread until it's done. Here they are just sockets waiting on the event loop. Queries go
+through SQLAlchemy's asyncio engine, and compressing and rendering frames runs in threads so
+they don't stall other clients. Everything else, including all writes apart from caching a
+missing goober frame, stays on the Flask app.
+
+Run it next to gunicorn and route the two GETs to it:
+    uvicorn asgi:app --port 5001
+"""
+import asyncio
+from datetime import datetime
+
+from quart import Quart, jsonify, request
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from werkzeug.http import quote_etag
+
+from app import create_app, rendering
+from app.imaging import Frame
+from app.models import CHECKIN_WINDOW, CheckIn, Event, Goober, GooberFrame, GooberImage, GooberSummary
+from app.rendering import RenderUnavailable
+from app.routes import InvalidArgument, encode_session, goobers_args, goobers_etag, goobers_response, plan_session, session_args, session_reply, station_arg
+from config import engine_options
+
+flask_app = create_app()
+app = Quart(__name__)
+app.config.from_mapping(flask_app.config)
+
+# share the Flask app's caches and render pool rather than building a second set
+qr_frames = flask_app.extensions['qr_frames']
+checkin_feed = flask_app.extensions['checkin_feed']
+render_service = flask_app.extensions['render_service']
+
+engine = create_async_engine(app.config['ASYNC_DATABASE_URI'], **engine_options(app.config['ASYNC_DATABASE_URI']))
+Session = async_sessionmaker(engine, expire_on_commit=False)
+
+@app.errorhandler(RenderUnavailable)
+async def render_unavailable(e: RenderUnavailable):
+    return jsonify({'error': str(e)}), 503, {'Retry-After': '1'}
+
+@app.errorhandler(InvalidArgument)
+async def invalid_argument(e: InvalidArgument):
+    return jsonify({'error': str(e)}), 400
+
+@app.route('/v1/goobers', methods=['GET'])
+async def get_goobers():
+    after, limit, name, fields = goobers_args(request.args, app.config)
+    async with Session() as session:
+        roster_version = (await session.execute(Goober.roster_version_query())).one()
+        etag = goobers_etag(roster_version, after, limit, name, fields)
+        if request.if_none_match.contains(etag):
+            return '', 304, {'ETag': quote_etag(etag)}
+        return goobers_response((await session.scalars(Goober.page_query(after, limit, fields, name))).all(), etag, limit, fields)
+
+@app.route('/v1/sessions', methods=['GET'])
+async def get_latest_session():
+    station_id = station_arg(request.args)
+    async with Session() as session:
+        current = checkin_feed.get(station_id)
+        if current is None:
+            checkin = await session.scalar(CheckIn.latest_query(station_id))
+            if checkin is not None:
+                current = checkin.to_session()
+                checkin_feed.publish(station_id, current)
+
+        if (not current or ((datetime.now() - current.timestamp) > CHECKIN_WINDOW)):
+            return jsonify({'error': 'No recent sessions found'}), 404
+
+        goober = await session.scalar(Goober.by_fingerprint_id_query(current.fingerprint_id))
+        if goober is None:
+            qr_frame = qr_frames.get(current.access_token)
+            if qr_frame is None:
+                url = f"https://goober.garden/v1/bubba-gum-shimp?access_token={current.access_token}"
+                qr_frame = await asyncio.to_thread(render_service.render, rendering.qr_frame, url)
+                qr_frames.set(current.access_token, qr_frame, expires_at=current.timestamp + CHECKIN_WINDOW)
+            return await session_response(201, qr_frame)
+
+        summary = await session.get(GooberSummary, goober.id)
+        recent_event_ids = summary.recent_event_ids if summary else []
+        events = {event.id: event for event in await session.scalars(Event.by_ids_query(recent_event_ids))} if recent_event_ids else {}
+        goober_json = goober.to_json_from(summary, events, image=False)
+
+        stored = await session.get(GooberFrame, goober.id)
+        if stored is None:
+            # same as the sync path: render a goober from before frames were precomputed once and keep it
+            image = await session.get(GooberImage, goober.image_sha256)
+            frame = await asyncio.to_thread(render_service.render, rendering.goober_frame, image.data)
+            await session.execute(GooberFrame.store_query(goober.id, frame, engine.dialect.name))
+            await session.commit()
+        else:
+            frame = stored.to_frame()
+        return await session_response(200, frame, goober_json)
+
+def encode_in_app_context(*args):
+    # the JSON provider pack_session uses lives on the Flask app
+    with flask_app.app_context():
+        return encode_session(*args)
+
+async def session_response(status: int, frame: Frame, goober_json: dict = None):
+    encoding_name, binary = session_args(request)
+    frame_id = await asyncio.to_thread(frame.frame_id)
+    reply = plan_session(request, status, frame_id, goober_json, encoding_name, binary)
+    if reply.not_modified:
+        return '', 304, reply.headers
+    body = await asyncio.to_thread(encode_in_app_context, status, frame, frame_id, goober_json, encoding_name, binary, reply.include_frame)
+    return session_reply(reply, status, body)
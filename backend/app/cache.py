@@ -0,0 +1,79 @@
+from bisect import bisect_right
+from collections import OrderedDict
+from datetime import datetime
+from itertools import accumulate
+from threading import Lock
+import random
+import time
+
+class FrameCache:
+    """A bounded, thread-safe LRU cache whose entries also expire at a fixed time."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if datetime.now() >= expires_at:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, expires_at: datetime):
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+class EventCatalog:
+    """Process-local copy of the event ids and weights for picking random events without the db."""
+
+    def __init__(self, ttl: float):
+        # other worker processes can add events too, so reload every ttl seconds regardless
+        self.ttl = ttl
+        self._ids = None
+        self._cumulative_weights = None
+        self._loaded_at = 0.0
+        self._version = None
+        self._lock = Lock()
+
+    def invalidate(self):
+        with self._lock:
+            self._ids = None
+
+    def check_version(self, version):
+        """Drop the cached events if the db's events version has changed since the last check."""
+        with self._lock:
+            if version != self._version:
+                self._ids = None
+                self._version = version
+
+    def choose(self, load):
+        """Pick a random id, weighted, reloading (id, weight) pairs from load() when stale."""
+        with self._lock:
+            if self._ids is None or time.monotonic() - self._loaded_at > self.ttl:
+                rows = load()
+                self._ids = [row_id for row_id, weight in rows]
+                self._cumulative_weights = list(accumulate(weight for row_id, weight in rows))
+                self._loaded_at = time.monotonic()
+            ids, cumulative_weights = self._ids, self._cumulative_weights
+
+        if not ids:
+            return None
+        index = bisect_right(cumulative_weights, random.random() * cumulative_weights[-1])
+        return ids[min(index, len(ids) - 1)]
@@ -0,0 +1,59 @@
+import time
+from datetime import datetime, timedelta
+
+import click
+import sqlalchemy as sa
+from flask import current_app
+from flask.cli import AppGroup
+
+from app import db, rendering
+from app.adventures import run_adventures
+from app.models import Goober, GooberFrame, GooberHistory, GooberSummary
+
+# registered at the top level of the flask command by init_app
+cli = AppGroup('goobers')
+
+@cli.command('backfill-frames')
+def backfill_frames():
+    """Render display frames for goobers created before frames were precomputed."""
+    goobers = db.session.scalars(sa.select(Goober).outerjoin(GooberFrame).where(GooberFrame.goober_id.is_(None))).all()
+    for goober in goobers:
+        # a display may have rendered it on first view in the meantime
+        GooberFrame.store(goober.id, rendering.goober_frame(goober.image_blob.data))
+    db.session.commit()
+    click.echo(f'Rendered {len(goobers)} goober frames')
+
+@cli.command('adventures')
+@click.option('--interval', type=float, default=lambda: current_app.config['ADVENTURE_TICK'], help='Seconds between runs.')
+@click.option('--once', is_flag=True, help='Run a single batch and exit.')
+def adventures(interval: float, once: bool):
+    """Generate adventures for goobers that are due for one. Run exactly one of these per database."""
+    while True:
+        count = run_adventures()
+        if count:
+            click.echo(f'{count} goobers went on an adventure')
+        if once:
+            break
+        db.session.remove()
+        time.sleep(interval)
+
+@cli.command('rebuild-summaries')
+def rebuild_summaries():
+    """Recompute every goober summary from stored history, keeping counts from compacted history."""
+    goober_ids = db.session.scalars(sa.select(Goober.id)).all()
+    for goober_id in goober_ids:
+        GooberSummary.rebuild(goober_id)
+    db.session.commit()
+    click.echo(f'Rebuilt {len(goober_ids)} goober summaries')
+
+@cli.command('compact-history')
+@click.option('--days', type=int, default=lambda: current_app.config['HISTORY_RETENTION_DAYS'], help='Keep this many days of history.')
+def compact_history(days: int):
+    """Delete history older than the retention period. Summaries keep its counts."""
+    deleted = GooberHistory.delete_before(datetime.now() - timedelta(days=days))
+    db.session.commit()
+    click.echo(f'Deleted {deleted} history rows older than {days} days')
+
+def init_app(app):
+    for command in cli.commands.values():
+        app.cli.add_command(command)
@@ -0,0 +1,85 @@
+import zlib
+
+from app.imaging import Frame
+
+# Frame encodings the display can ask for with `?encoding=`. The ids are the
+# `encoding` byte of the binary session header.
+ENCODING_RAW = 0
+ENCODING_RLE = 1
+ENCODING_ZLIB = 2
+ENCODINGS = {'raw': ENCODING_RAW, 'rle': ENCODING_RLE, 'zlib': ENCODING_ZLIB}
+
+# RLE packets start with a control byte. With the high bit set the next item is
+# repeated (control & 0x7F) + 1 times, otherwise (control + 1) literal items follow.
+# Items are 2 byte RGB565 pixels for the bitmap and single bytes for the mask, and
+# the decoder knows from width and height when a section ends, so a microcontroller
+# can decode straight into its framebuffer.
+RLE_MAX_PACKET = 128
+
+def rle_literals(out: bytearray, data: bytes, item_size: int, start: int, end: int):
+    for chunk in range(start, end, RLE_MAX_PACKET):
+        count = min(RLE_MAX_PACKET, end - chunk)
+        out.append(count - 1)
+        out.extend(data[chunk * item_size:(chunk + count) * item_size])
+
+def rle_encode(data: bytes, item_size: int):
+    import numpy as np
+    items = np.frombuffer(data, dtype='<u2' if item_size == 2 else np.uint8)
+    if items.size == 0:
+        return b''
+    starts = np.concatenate(([0], np.flatnonzero(items[1:] != items[:-1]) + 1))
+    lengths = np.diff(np.append(starts, items.size))
+
+    out = bytearray()
+    literal_start = None
+    for start, length in zip(starts.tolist(), lengths.tolist()):
+        if length == 1:
+            if literal_start is None:
+                literal_start = start
+            continue
+        if literal_start is not None:
+            rle_literals(out, data, item_size, literal_start, start)
+            literal_start = None
+        item = data[start * item_size:(start + 1) * item_size]
+        while length > 0:
+            count = min(RLE_MAX_PACKET, length)
+            out.append(0x80 | (count - 1))
+            out.extend(item)
+            length -= count
+    if literal_start is not None:
+        rle_literals(out, data, item_size, literal_start, items.size)
+    return bytes(out)
+
+def rle_decode(data: bytes, item_size: int, count: int):
+    """Decode count items, returning the decoded bytes and how many input bytes were used."""
+    out = bytearray()
+    size = count * item_size
+    i = 0
+    while len(out) < size:
+        control = data[i]
+        i += 1
+        n = (control & 0x7F) + 1
+        if control & 0x80:
+            out += data[i:i + item_size] * n
+            i += item_size
+        else:
+            out += data[i:i + n * item_size]
+            i += n * item_size
+    return bytes(out), i
+
+def compress_frame(frame: Frame, encoding: int):
+    if encoding == ENCODING_RLE:
+        return frame._replace(bitmap=rle_encode(frame.bitmap, 2), mask=rle_encode(frame.mask, 1))
+    if encoding == ENCODING_ZLIB:
+        return frame._replace(bitmap=zlib.compress(frame.bitmap), mask=zlib.compress(frame.mask))
+    return frame
+
+def decompress_section(data: bytes, encoding: int, item_size: int, count: int):
+    """Decode one bitmap or mask section, returning it and how many input bytes were used."""
+    if encoding == ENCODING_RLE:
+        return rle_decode(data, item_size, count)
+    if encoding == ENCODING_ZLIB:
+        decompressor = zlib.decompressobj()
+        section = decompressor.decompress(data)
+        return section, len(data) - len(decompressor.unused_data)
+    return bytes(data[:item_size * count]), item_size * count
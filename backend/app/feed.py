@@ -0,0 +1,56 @@
+from datetime import datetime
+from threading import Condition
+from typing import NamedTuple
+import time
+
+class CurrentSession(NamedTuple):
+    """The parts of a station's latest check-in that rendering its session needs."""
+    id: int
+    fingerprint_id: int
+    timestamp: datetime
+    access_token: str
+
+class CheckInFeed:
+    """Each station's latest check-in as seen by this process; wakes long-polling displays when one changes.
+
+    Entries are trusted for ttl seconds, after which the caller should reload the station
+    from the db, since check-ins taken by other worker processes aren't published here.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._sessions = {}
+        self._invalidations = {}
+        self._condition = Condition()
+
+    def get(self, station_id: str):
+        with self._condition:
+            entry = self._sessions.get(station_id)
+        if entry is None or time.monotonic() - entry[1] > self.ttl:
+            return None
+        return entry[0]
+
+    def publish(self, station_id: str, session: CurrentSession):
+        with self._condition:
+            entry = self._sessions.get(station_id)
+            # a batch upload can carry check-ins older than the current one
+            if entry is None or (session.timestamp, session.id) >= (entry[0].timestamp, entry[0].id):
+                self._sessions[station_id] = (session, time.monotonic())
+            self._condition.notify_all()
+
+    def invalidate(self, station_ids):
+        """Forget these stations so the next lookup goes to the db, and wake their displays."""
+        with self._condition:
+            for station_id in station_ids:
+                self._sessions.pop(station_id, None)
+                self._invalidations[station_id] = self._invalidations.get(station_id, 0) + 1
+            self._condition.notify_all()
+
+    def wait(self, station_id: str, after_id: int, timeout: float):
+        """Block until the station has a check-in newer than after_id, it's invalidated, or timeout seconds pass."""
+        def changed():
+            entry = self._sessions.get(station_id)
+            return self._invalidations.get(station_id, 0) != invalidations or (entry is not None and entry[0].id > after_id)
+        with self._condition:
+            invalidations = self._invalidations.get(station_id, 0)
+            return self._condition.wait_for(changed, timeout)
@@ -0,0 +1,124 @@
+import base64
+import hashlib
+import io
+import sys
+from functools import cache
+from typing import NamedTuple
+
+# numpy, PIL and qrcode are imported inside the functions that use them: together they
+# take longer to import than the rest of the app, and the CLI, migrations and most
+# requests never render a frame.
+
+QR_FRAME_HEIGHT = 480
+GOOBER_FRAME_WIDTH = 480
+GOOBER_FRAME_HEIGHT = 360
+# refuse to decode uploads bigger than this, whatever their file size
+MAX_UPLOAD_PIXELS = 4096 * 4096
+UPLOAD_FORMATS = ('PNG', 'JPEG', 'WEBP', 'GIF')
+
+
+def rgb888_to_rgb565(red8, green8, blue8):
+    # Convert 8-bit red to 5-bit red.
+    red5 = round(red8 / 255 * 31)
+    # Convert 8-bit green to 6-bit green.
+    green6 = round(green8 / 255 * 63)
+    # Convert 8-bit blue to 5-bit blue.
+    blue5 = round(blue8 / 255 * 31)
+
+    # Shift the red value to the left by 11 bits.
+    red5_shifted = red5 << 11
+    # Shift the green value to the left by 5 bits.
+    green6_shifted = green6 << 5
+
+    # Combine the red, green, and blue values.
+    rgb565 = red5_shifted | green6_shifted | blue5
+
+    return rgb565
+
+@cache
+def rgb565_tables():
+    """Per-channel lookup tables built from rgb888_to_rgb565 itself so the vectorized
+    encoder rounds exactly like the scalar one."""
+    import numpy as np
+    red = np.array([rgb888_to_rgb565(v, 0, 0) for v in range(256)], dtype=np.uint16)
+    green = np.array([rgb888_to_rgb565(0, v, 0) for v in range(256)], dtype=np.uint16)
+    blue = np.array([rgb888_to_rgb565(0, 0, v) for v in range(256)], dtype=np.uint16)
+    return red, green, blue
+
+def encode_frame(img):
+    """Encode an image as raw little-endian RGB565 bitmap bytes and a 1-bit MSB-first alpha mask."""
+    import numpy as np
+    if img.mode != 'RGBA':
+        img = img.convert('RGBA')
+    pixels = np.asarray(img, dtype=np.uint8).reshape(img.height, img.width, 4)
+
+    red565, green565, blue565 = rgb565_tables()
+    rgb565 = red565[pixels[..., 0]] | green565[pixels[..., 1]] | blue565[pixels[..., 2]]
+    bitmap_bytes = rgb565.astype('<u2').tobytes()
+    mask_bytes = np.packbits(pixels[..., 3] > 0, axis=1, bitorder='big').tobytes()
+    return bitmap_bytes, mask_bytes
+
+class Frame(NamedTuple):
+    """An encoded display frame: RGB565 bitmap bytes plus the 1-bit transparency mask."""
+    width: int
+    height: int
+    bitmap: bytes
+    mask: bytes
+
+    def to_json(self):
+        return {"bitmap": base64.b64encode(self.bitmap).decode("utf-8"), "mask": base64.b64encode(self.mask).decode("utf-8"), "width": self.width, "height": self.height}
+
+    def frame_id(self):
+        """Short hash of the pixels, so a display can say which frame it already has."""
+        digest = hashlib.blake2b(f"{self.width}x{self.height}".encode("utf-8"), digest_size=8)
+        digest.update(self.bitmap)
+        digest.update(self.mask)
+        return digest.hexdigest()
+
+def render_frame(img):
+    bitmap_bytes, mask_bytes = encode_frame(img)
+    return Frame(img.width, img.height, bitmap_bytes, mask_bytes)
+
+def png_to_json(img):
+    return render_frame(img).to_json()
+
+def render_goober(image_data):
+    """Decode a goober's PNG bytes and scale them down to the display's frame height."""
+    from PIL import Image
+    img = Image.open(io.BytesIO(image_data))
+    img.thumbnail([sys.maxsize, GOOBER_FRAME_HEIGHT], Image.Resampling.LANCZOS)
+    return img
+
+def render_qr(url):
+    """Render a QR code for url scaled to the display's frame height."""
+    import qrcode
+    from PIL import Image
+    img = qrcode.make(url).convert("RGBA")
+    img.thumbnail([sys.maxsize, QR_FRAME_HEIGHT], Image.Resampling.LANCZOS)
+    return img
+
+def normalize_goober(image_data):
+    """Validate an uploaded drawing, crop away transparent margins and shrink it to fit the display.
+
+    Returns PNG bytes. Raises ValueError if the upload isn't an image we accept.
+    """
+    from PIL import Image
+    try:
+        img = Image.open(io.BytesIO(image_data))
+        if img.format not in UPLOAD_FORMATS:
+            raise ValueError(f'Images must be one of {", ".join(UPLOAD_FORMATS)}')
+        if img.width * img.height > MAX_UPLOAD_PIXELS:
+            raise ValueError('Image dimensions are too large')
+        img = img.convert('RGBA')
+    except (OSError, Image.DecompressionBombError) as e:
+        raise ValueError('Not a valid image') from e
+
+    bbox = img.getchannel('A').getbbox()
+    if bbox is None:
+        raise ValueError('Image is empty')
+    img = img.crop(bbox)
+    img.thumbnail((GOOBER_FRAME_WIDTH, GOOBER_FRAME_HEIGHT), Image.Resampling.LANCZOS)
+
+    buffer = io.BytesIO()
+    img.save(buffer, format='PNG', optimize=True)
+    return buffer.getvalue()
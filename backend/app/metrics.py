@@ -0,0 +1,117 @@
+import json
+import logging
+import os
+from contextlib import contextmanager
+from time import perf_counter
+
+from flask import Flask, Response, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger('app.metrics')
+
+# created by init_app, so prometheus_client is only imported when metrics are on
+REQUEST_TIME = DB_QUERIES = DB_TIME = IMAGE_TIME = None
+
+def _create_histograms():
+    global REQUEST_TIME, DB_QUERIES, DB_TIME, IMAGE_TIME
+    if REQUEST_TIME is not None:
+        # another app in this process already registered them
+        return
+    from prometheus_client import Histogram
+    REQUEST_TIME = Histogram('goobers_request_seconds', 'Wall time per request', ['endpoint', 'method', 'status'])
+    DB_QUERIES = Histogram('goobers_request_db_queries', 'SQL statements per request', ['endpoint'],
+                           buckets=(0, 1, 2, 3, 5, 8, 13, 21, 50, 100))
+    DB_TIME = Histogram('goobers_request_db_seconds', 'Time spent in SQL per request', ['endpoint'])
+    IMAGE_TIME = Histogram('goobers_request_image_seconds', 'Time spent rendering, normalizing and compressing images per request', ['endpoint'])
+
+class RequestMetrics:
+    __slots__ = ('start', 'db_queries', 'db_time', 'image_time')
+
+    def __init__(self):
+        self.start = perf_counter()
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.image_time = 0.0
+
+def current() -> RequestMetrics | None:
+    if not has_request_context():
+        return None
+    return g.get('request_metrics')
+
+@contextmanager
+def image_timer():
+    """Counts the time inside the block as image processing for the current request; a no-op when metrics are off."""
+    metrics = current()
+    if metrics is None:
+        yield
+        return
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        metrics.image_time += perf_counter() - start
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context.metrics_start = perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    metrics = current()
+    if metrics is not None:
+        metrics.db_queries += 1
+        metrics.db_time += perf_counter() - context.metrics_start
+
+def _start_request():
+    g.request_metrics = RequestMetrics()
+
+def _finish_request(response: Response):
+    metrics = g.pop('request_metrics', None)
+    if metrics is None:
+        return response
+    duration = perf_counter() - metrics.start
+    endpoint = request.endpoint or 'unmatched'
+
+    REQUEST_TIME.labels(endpoint, request.method, response.status_code).observe(duration)
+    DB_QUERIES.labels(endpoint).observe(metrics.db_queries)
+    DB_TIME.labels(endpoint).observe(metrics.db_time)
+    IMAGE_TIME.labels(endpoint).observe(metrics.image_time)
+    logger.info(json.dumps({
+        'endpoint': endpoint,
+        'method': request.method,
+        'path': request.path,
+        'status': response.status_code,
+        'duration_ms': round(duration * 1000, 2),
+        'db_queries': metrics.db_queries,
+        'db_ms': round(metrics.db_time * 1000, 2),
+        'image_ms': round(metrics.image_time * 1000, 2),
+        'bytes': response.content_length,
+    }))
+    return response
+
+def get_metrics():
+    from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, generate_latest, multiprocess
+    # under gunicorn every worker writes its samples to PROMETHEUS_MULTIPROC_DIR, so a scrape sees all of them
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
+
+def init_app(app: Flask):
+    """Times every request and serves the results on /metrics. Only called when METRICS_ENABLED is set."""
+    _create_histograms()
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.add_url_rule('/metrics', 'metrics', get_metrics)
+    if event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        # the engine hooks and log handler are process-wide and already set up
+        return
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    # one bare JSON object per line, so log shippers can parse it without Flask's prefix
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
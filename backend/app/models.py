@@ -2,10 +2,38 @@ from typing import Optional
 import sqlalchemy as sa
 import sqlalchemy.orm as so
 from sqlalchemy import Text
+from sqlalchemy.dialects import postgresql, sqlite
+from flask import current_app
+from werkzeug.local import LocalProxy
 from app import db
-import random
+from app.cache import EventCatalog
+from app.feed import CurrentSession
+from app.imaging import Frame, render_frame, render_goober
+import base64
+import hashlib
+import secrets
 from datetime import datetime, timedelta
 
+CHECKIN_WINDOW = timedelta(minutes=5)
+# goobers on display go on an adventure this often, everyone else at least this often
+ADVENTURE_INTERVAL = timedelta(seconds=30)
+IDLE_ADVENTURE_INTERVAL = timedelta(days=6)
+# to_json only reports this many of a goober's most recent events, which is what GooberSummary keeps
+GOOBER_HISTORY_LIMIT = 50
+# check-ins from scanners that don't send a station_id
+DEFAULT_STATION = 'default'
+
+event_catalog: EventCatalog = LocalProxy(lambda: current_app.extensions['event_catalog'])
+
+def init_app(app):
+    app.extensions['event_catalog'] = EventCatalog(ttl=app.config['EVENT_CATALOG_TTL'])
+
+def dialect_insert(model, dialect_name: Optional[str] = None):
+    """INSERT construct with ON CONFLICT support for the configured database, or for dialect_name."""
+    if (dialect_name or db.engine.dialect.name) == 'postgresql':
+        return postgresql.insert(model)
+    return sqlite.insert(model)
+
 class Fingerprint(db.Model):
     __tablename__ = 'fingerprints'
 
@@ -16,75 +44,269 @@ class Fingerprint(db.Model):
     def get_by_fingerprint(cls, fingerprint: str):
         return db.session.scalar(sa.select(cls).where(cls.fingerprint == fingerprint))
     
+    @classmethod
+    def upsert(cls, fingerprints: list[str]):
+        """Insert any fingerprints that don't exist yet and return {fingerprint: id} for all of them."""
+        # sorted so concurrent batches lock the existing rows in the same order and can't deadlock
+        insert = dialect_insert(cls).values([{'fingerprint': fingerprint} for fingerprint in sorted(set(fingerprints))])
+        # a no-op update rather than DO NOTHING so RETURNING includes the rows that already existed
+        insert = insert.on_conflict_do_update(index_elements=[cls.fingerprint], set_={'fingerprint': insert.excluded.fingerprint})
+        return {fingerprint: id for id, fingerprint in db.session.execute(insert.returning(cls.id, cls.fingerprint))}
+
     @classmethod
     def get_available_fingerprints(cls):
-        used_fingerprints = db.session.scalars(sa.select(cls.fingerprint)).all()
-        return random.choice([num for num in range(80) if str(num) not in used_fingerprints])
+        return FingerprintSlot.reserve()
     
     def __repr__(self):
         return f'<Fingerprint {self.fingerprint}>'
 
+class FingerprintSlot(db.Model):
+    __tablename__ = 'fingerprint_slots'
+
+    slot: so.Mapped[int] = db.mapped_column(db.Integer, primary_key=True, autoincrement=False)
+    reserved_until: so.Mapped[Optional[datetime]] = db.mapped_column(db.DateTime)
+
+    @classmethod
+    def ensure_slots(cls, count: int):
+        # sensor ids run from 1, the firmware treats 0 as "no id"
+        existing = db.session.scalar(sa.select(sa.func.count(cls.slot)).where(cls.slot.between(1, count)))
+        if existing < count:
+            present = set(db.session.scalars(sa.select(cls.slot)).all())
+            db.session.add_all([cls(slot=slot) for slot in range(1, count + 1) if slot not in present])
+            try:
+                db.session.commit()
+            except sa.exc.IntegrityError:
+                # another worker added the same slots first
+                db.session.rollback()
+
+    @classmethod
+    def reserve(cls):
+        """Hand out the lowest sensor slot that has no fingerprint and no live reservation."""
+        count = current_app.config['FINGERPRINT_SLOTS']
+        cls.ensure_slots(count)
+        now = datetime.now()
+        enrolled = sa.select(Fingerprint.id).where(Fingerprint.fingerprint == sa.cast(cls.slot, Text))
+        slot = db.session.scalar(
+            sa.select(cls)
+            .where(cls.slot.between(1, count), sa.or_(cls.reserved_until.is_(None), cls.reserved_until < now), ~enrolled.exists())
+            .order_by(cls.slot)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+        )
+        if slot is None:
+            db.session.rollback()
+            return None
+        slot.reserved_until = now + timedelta(seconds=current_app.config['FINGERPRINT_RESERVATION_TTL'])
+        db.session.commit()
+        return slot.slot
+
+    def __repr__(self):
+        return f'<FingerprintSlot {self.slot}>'
+
+class GooberImage(db.Model):
+    __tablename__ = 'goober_images'
+
+    sha256: so.Mapped[str] = db.mapped_column(Text, primary_key=True)
+    data: so.Mapped[bytes] = db.mapped_column(db.LargeBinary)
+
+    @classmethod
+    def store(cls, data: bytes):
+        """Get or create the image with these bytes; identical drawings share one row."""
+        sha256 = hashlib.sha256(data).hexdigest()
+        return db.session.get(cls, sha256) or cls(sha256=sha256, data=data)
+
+    def __repr__(self):
+        return f'<GooberImage {self.sha256[:12]}>'
+
 class Goober(db.Model):
     __tablename__ = 'goobers'
 
     id: so.Mapped[int] = db.mapped_column(db.Integer, primary_key=True)
     name: so.Mapped[str] = db.mapped_column(Text)
-    fingerprint_id: so.Mapped[int] = db.mapped_column(db.Integer, db.ForeignKey('fingerprints.id'))
-    image: so.Mapped[str] = db.mapped_column(Text)
+    fingerprint_id: so.Mapped[int] = db.mapped_column(db.Integer, db.ForeignKey('fingerprints.id'), index=True, unique=True)
+    image_sha256: so.Mapped[str] = db.mapped_column(Text, db.ForeignKey('goober_images.sha256'))
 
     fingerprint: so.Mapped[Fingerprint] = db.relationship('Fingerprint', backref='goobers')
+    image_blob: so.Mapped[GooberImage] = db.relationship('GooberImage')
+
+    @property
+    def image(self):
+        """The drawing as base64 PNG, which is how the API has always sent it."""
+        return base64.b64encode(self.image_blob.data).decode('utf-8')
 
     @classmethod
     def get_by_fingerprint(cls, fingerprint: Fingerprint):
-        return db.session.scalar(sa.select(cls).where(Goober.fingerprint_id == fingerprint.id))
+        return cls.get_by_fingerprint_id(fingerprint.id)
+
+    @classmethod
+    def get_by_fingerprint_id(cls, fingerprint_id: int):
+        return db.session.scalar(cls.by_fingerprint_id_query(fingerprint_id))
+
+    # the *_query classmethods build the statement without running it, so the async read
+    # path in app.async_reads can run the same queries on its own session
+
+    @classmethod
+    def by_fingerprint_id_query(cls, fingerprint_id: int):
+        return sa.select(cls).options(so.joinedload(cls.fingerprint)).where(Goober.fingerprint_id == fingerprint_id)
     
     @classmethod
     def get_all(cls):
-        return db.session.scalars(sa.select(cls)).all()
+        return db.session.scalars(sa.select(cls).options(so.joinedload(cls.fingerprint))).all()
+
+    @classmethod
+    def get_page(cls, after: int, limit: int, fields: list[str], name: Optional[str] = None):
+        return db.session.scalars(cls.page_query(after, limit, fields, name)).all()
+
+    @classmethod
+    def page_query(cls, after: int, limit: int, fields: list[str], name: Optional[str] = None):
+        """Keyset page of goobers with id > after, loading only the columns fields needs."""
+        columns = [cls.id, cls.name] if 'name' in fields else [cls.id]
+        query = sa.select(cls).where(cls.id > after).order_by(cls.id).limit(limit)
+        if 'fingerprint' in fields:
+            query = query.options(so.joinedload(cls.fingerprint))
+        if 'image' in fields:
+            columns.append(cls.image_sha256)
+            query = query.options(so.selectinload(cls.image_blob))
+        query = query.options(so.load_only(*columns))
+        if name:
+            query = query.where(cls.name.icontains(name, autoescape=True))
+        return query
+
+    @classmethod
+    def get_roster_version(cls):
+        return db.session.execute(cls.roster_version_query()).one()
+
+    @classmethod
+    def roster_version_query(cls):
+        # goobers are only ever added, so the count and highest id change whenever the roster does
+        return sa.select(sa.func.count(cls.id), sa.func.max(cls.id))
+
+    def to_fields(self, fields: list[str]):
+        return {field: self.fingerprint.fingerprint if field == 'fingerprint' else getattr(self, field) for field in fields}
     
-    def to_json(self):
-        goober_history = GooberHistory.get_by_fingerprint(self.id)
-        return {
+    def to_json(self, image: bool = True):
+        summary = GooberSummary.get_by_goober(self.id)
+        events = Event.get_by_ids(summary.recent_event_ids if summary else [])
+        return self.to_json_from(summary, events, image)
+
+    def to_json_from(self, summary: Optional['GooberSummary'], events: dict[int, 'Event'], image: bool = True):
+        """to_json with the summary and its recent events already loaded."""
+        recent_event_ids = summary.recent_event_ids if summary else []
+        recent_events = [events[event_id] for event_id in recent_event_ids if event_id in events]
+        goober_json = {
             'name': self.name,
             'fingerprint': self.fingerprint.fingerprint,
-            'image': self.image,
-            'last_seen': goober_history[0].timestamp if goober_history else None,
-            'events': [{'event': history.event.name, 'description': history.event.description} for history in goober_history],
+            'last_seen': summary.last_seen if summary else None,
+            'events': [{'event': event.name, 'description': event.description} for event in recent_events],
             'stats': [  
-                {'type': 'float', 'stat_name': history.event.stat_name, 'stat_value': history.event.value_float} if history.event.type == 'float' else
-                {'type': 'str', 'stat_name': history.event.stat_name, 'stat_value': history.event.value_string}
-                for history in goober_history[0:5]]
+                {'type': 'float', 'stat_name': event.stat_name, 'stat_value': event.value_float} if event.type == 'float' else
+                {'type': 'str', 'stat_name': event.stat_name, 'stat_value': event.value_string}
+                for event in recent_events[0:5]]
         }
+        if image:
+            goober_json['image'] = self.image
+        return goober_json
     
-    def go_on_adventure(self):
-        history = GooberHistory.get_by_fingerprint(self.id)
-
-        if not history or (datetime.now() - history[0].timestamp) > timedelta(seconds=30):
-            event: Event = Event.get_random_event()
-            db.session.add(GooberHistory(goober_id=self.id, event_id=event.id, timestamp=datetime.now()))
-            db.session.commit()
+    @classmethod
+    def get_due_for_adventure(cls, now: datetime):
+        """Ids of goobers on display that haven't adventured for ADVENTURE_INTERVAL, or anyone idle for IDLE_ADVENTURE_INTERVAL."""
+        last_seen = GooberSummary.last_seen
+        on_display = (
+            sa.select(CheckIn.id)
+            .where(CheckIn.fingerprint_id == cls.fingerprint_id, CheckIn.timestamp >= now - CHECKIN_WINDOW)
+            .exists()
+        )
+        return db.session.scalars(
+            sa.select(cls.id)
+            .outerjoin(GooberSummary, GooberSummary.goober_id == cls.id)
+            .where(sa.or_(
+                last_seen.is_(None),
+                last_seen < now - IDLE_ADVENTURE_INTERVAL,
+                sa.and_(last_seen < now - ADVENTURE_INTERVAL, on_display)
+            ))
+        ).all()
 
 
     def __repr__(self):
         return f'<Goober {self.name}>'
     
+class GooberFrame(db.Model):
+    __tablename__ = 'goober_frames'
+
+    goober_id: so.Mapped[int] = db.mapped_column(db.Integer, db.ForeignKey('goobers.id'), primary_key=True)
+    width: so.Mapped[int] = db.mapped_column(db.Integer)
+    height: so.Mapped[int] = db.mapped_column(db.Integer)
+    bitmap: so.Mapped[bytes] = db.mapped_column(db.LargeBinary)
+    mask: so.Mapped[bytes] = db.mapped_column(db.LargeBinary)
+
+    goober: so.Mapped[Goober] = db.relationship('Goober', backref=so.backref('frame', uselist=False))
+
+    @classmethod
+    def get_by_goober(cls, goober_id: int):
+        return db.session.get(cls, goober_id)
+
+    @classmethod
+    def render(cls, goober: Goober):
+        return cls.from_frame(goober, render_frame(render_goober(goober.image_blob.data)))
+
+    @classmethod
+    def from_frame(cls, goober: Goober, frame: Frame):
+        return cls(goober=goober, width=frame.width, height=frame.height, bitmap=frame.bitmap, mask=frame.mask)
+
+    @classmethod
+    def store(cls, goober_id: int, frame: Frame):
+        db.session.execute(cls.store_query(goober_id, frame))
+
+    @classmethod
+    def store_query(cls, goober_id: int, frame: Frame, dialect_name: Optional[str] = None):
+        """Insert a frame rendered on first display, unless another request already stored one."""
+        insert = dialect_insert(cls, dialect_name).values(goober_id=goober_id, width=frame.width, height=frame.height, bitmap=frame.bitmap, mask=frame.mask)
+        return insert.on_conflict_do_nothing(index_elements=[cls.goober_id])
+
+    def to_frame(self):
+        return Frame(self.width, self.height, self.bitmap, self.mask)
+
+    def to_json(self):
+        return self.to_frame().to_json()
+
+    def __repr__(self):
+        return f'<GooberFrame {self.goober_id} {self.width}x{self.height}>'
+
 class CheckIn(db.Model):
     __tablename__ = 'checkins'
+    __table_args__ = (
+        db.Index('ix_checkins_fingerprint_id_timestamp', 'fingerprint_id', 'timestamp'),
+        db.Index('ix_checkins_station_id_timestamp', 'station_id', 'timestamp'),
+    )
 
     id: so.Mapped[int] = db.mapped_column(db.Integer, primary_key=True)
     fingerprint_id: so.Mapped[int] = db.mapped_column(db.Integer, db.ForeignKey('fingerprints.id'))
     timestamp: so.Mapped[sa.DateTime] = db.mapped_column(db.DateTime, index=True)
+    access_token: so.Mapped[Optional[str]] = db.mapped_column(Text, index=True, unique=True, default=lambda: secrets.token_hex(32))
+    station_id: so.Mapped[str] = db.mapped_column(Text, default=DEFAULT_STATION, server_default=DEFAULT_STATION)
 
     fingerprint: so.Mapped[Fingerprint] = db.relationship('Fingerprint', backref='checkins')
 
     @classmethod
-    def get_latest(cls):
-        return db.session.scalars(sa.select(cls).order_by(CheckIn.timestamp.desc())).first()
+    def get_latest(cls, station_id: str = DEFAULT_STATION):
+        return db.session.scalar(cls.latest_query(station_id))
+
+    @classmethod
+    def latest_query(cls, station_id: str = DEFAULT_STATION):
+        return sa.select(cls).where(cls.station_id == station_id).order_by(CheckIn.timestamp.desc()).limit(1)
+
+    @classmethod
+    def create_many(cls, checkins: list[dict]):
+        """Insert check-ins in a single statement and return their ids."""
+        return db.session.scalars(sa.insert(cls).returning(cls.id), checkins).all()
     
     @classmethod
-    def get_within_timeframe(cls, minutes: int):
-        cutoff_time = datetime.now() - timedelta(minutes=minutes)
-        return db.session.scalars(sa.select(cls).where(cls.timestamp >= cutoff_time)).all()
+    def get_by_access_token(cls, access_token: str):
+        cutoff_time = datetime.now() - CHECKIN_WINDOW
+        return db.session.scalar(sa.select(cls).where(cls.access_token == access_token, cls.timestamp >= cutoff_time))
+
+    def to_session(self):
+        return CurrentSession(self.id, self.fingerprint_id, self.timestamp, self.access_token)
 
     def __repr__(self):
         return f'<CheckIn {self.goober.name} at {self.timestamp}>'
@@ -99,20 +321,43 @@ class Event(db.Model):
     type: so.Mapped[str] = db.mapped_column(Text)
     value_float: so.Mapped[Optional[float]] = db.mapped_column(db.Float)
     value_string: so.Mapped[Optional[str]] = db.mapped_column(Text)
+    weight: so.Mapped[float] = db.mapped_column(db.Float, default=1.0, server_default='1')
 
     @classmethod
     def get_all_ids(cls):
         return db.session.scalars(sa.select(cls.id)).all()
     
     @classmethod
-    def get_random_event(cls):
-        return random.choice(db.session.scalars(sa.select(cls)).all())
+    def get_by_ids(cls, ids: list[int]):
+        if not ids:
+            return {}
+        return {event.id: event for event in db.session.scalars(cls.by_ids_query(ids))}
+
+    @classmethod
+    def by_ids_query(cls, ids: list[int]):
+        return sa.select(cls).where(cls.id.in_(set(ids)))
+
+    @classmethod
+    def get_weights(cls):
+        return db.session.execute(sa.select(cls.id, cls.weight).where(cls.weight > 0).order_by(cls.id)).all()
+
+    @classmethod
+    def get_catalog_version(cls):
+        # changes whenever an event is added or a weight changes; cheap enough to check every adventure tick
+        return tuple(db.session.execute(sa.select(sa.func.count(cls.id), sa.func.max(cls.id), sa.func.sum(cls.weight))).one())
+
+    @classmethod
+    def get_random_event_id(cls):
+        return event_catalog.choose(cls.get_weights)
     
     def __repr__(self):
         return f'<Event {self.name}>'
       
 class GooberHistory(db.Model):
     __tablename__ = 'goober_history'
+    __table_args__ = (
+        db.Index('ix_goober_history_goober_id_timestamp', 'goober_id', 'timestamp'),
+    )
 
     id: so.Mapped[int] = db.mapped_column(db.Integer, primary_key=True)
     goober_id: so.Mapped[int] = db.mapped_column(db.Integer, db.ForeignKey('goobers.id'))
@@ -123,8 +368,78 @@ class GooberHistory(db.Model):
     event: so.Mapped[Event] = db.relationship('Event', backref='goober_history')
 
     @classmethod
-    def get_by_fingerprint(cls, goober_id: int):
-        return db.session.scalars(sa.select(cls).where(cls.goober_id == goober_id).order_by(GooberHistory.timestamp.desc())).all()
+    def create_many(cls, history: list[dict]):
+        db.session.execute(sa.insert(cls), history)
+        GooberSummary.record(history)
+
+    @classmethod
+    def delete_before(cls, cutoff: datetime):
+        return db.session.execute(sa.delete(cls).where(cls.timestamp < cutoff)).rowcount
+
+    def __repr__(self):
+        return f'<GooberHistory {self.goober.name} - {self.event.name} at {self.timestamp}>'
+
+class GooberSummary(db.Model):
+    __tablename__ = 'goober_summaries'
+
+    goober_id: so.Mapped[int] = db.mapped_column(db.Integer, db.ForeignKey('goobers.id'), primary_key=True)
+    last_seen: so.Mapped[Optional[datetime]] = db.mapped_column(db.DateTime, index=True)
+    adventure_count: so.Mapped[int] = db.mapped_column(db.Integer, default=0)
+    # newest first, at most GOOBER_HISTORY_LIMIT
+    recent_event_ids: so.Mapped[list] = db.mapped_column(db.JSON, default=list)
+    # {event id: times it happened}, including history that has since been compacted away
+    event_counts: so.Mapped[dict] = db.mapped_column(db.JSON, default=dict)
+
+    @classmethod
+    def get_by_goober(cls, goober_id: int):
+        return db.session.get(cls, goober_id)
+
+    @classmethod
+    def record(cls, history: list[dict]):
+        """Fold newly written history rows into their goobers' summaries."""
+        goober_ids = {row['goober_id'] for row in history}
+        summaries = {summary.goober_id: summary for summary in db.session.scalars(sa.select(cls).where(cls.goober_id.in_(goober_ids)))}
+        for row in sorted(history, key=lambda row: row['timestamp']):
+            summary = summaries.get(row['goober_id'])
+            if summary is None:
+                summary = summaries[row['goober_id']] = cls(goober_id=row['goober_id'], adventure_count=0, recent_event_ids=[], event_counts={})
+                db.session.add(summary)
+            summary.add(row['event_id'], row['timestamp'])
+
+    @classmethod
+    def rebuild(cls, goober_id: int):
+        """Recompute a summary from the history that is still stored, merged with the existing summary.
+
+        Compacted history only survives in the summary, so counts never go below what the
+        summary already had, and its older recent events are kept after the stored ones.
+        """
+        existing = cls.get_by_goober(goober_id)
+        summary = cls(goober_id=goober_id, adventure_count=0, recent_event_ids=[], event_counts={})
+        rows = db.session.execute(sa.select(GooberHistory.event_id, GooberHistory.timestamp).where(GooberHistory.goober_id == goober_id).order_by(GooberHistory.timestamp)).all()
+        for event_id, timestamp in rows:
+            summary.add(event_id, timestamp)
+        if existing is None:
+            db.session.add(summary)
+            return summary
+
+        counts = dict(existing.event_counts)
+        for event_id, count in summary.event_counts.items():
+            counts[event_id] = max(counts.get(event_id, 0), count)
+        existing.event_counts = counts
+        existing.adventure_count = max(existing.adventure_count, sum(counts.values()))
+        existing.recent_event_ids = (summary.recent_event_ids + existing.recent_event_ids[len(summary.recent_event_ids):])[:GOOBER_HISTORY_LIMIT]
+        if summary.last_seen is not None and (existing.last_seen is None or summary.last_seen > existing.last_seen):
+            existing.last_seen = summary.last_seen
+        return existing
+
+    def add(self, event_id: int, timestamp: datetime):
+        # assign new containers so the JSON columns are marked dirty
+        self.last_seen = timestamp if self.last_seen is None else max(self.last_seen, timestamp)
+        self.adventure_count += 1
+        self.recent_event_ids = ([event_id] + self.recent_event_ids)[:GOOBER_HISTORY_LIMIT]
+        counts = dict(self.event_counts)
+        counts[str(event_id)] = counts.get(str(event_id), 0) + 1
+        self.event_counts = counts
 
     def __repr__(self):
-        return f'<GooberHistory {self.goober.name} - {self.event.name} at {self.timestamp}>'
\ No newline at end of file
+        return f'<GooberSummary {self.goober_id} last seen {self.last_seen}>'
@@ -0,0 +1,53 @@
+import json
+import struct
+
+from flask import current_app
+
+from app.compression import ENCODING_RAW, ENCODINGS, decompress_section
+from app.imaging import Frame
+
+# Binary session payload for the display, selected with `Accept: application/octet-stream`.
+#
+# All integers are little-endian, matching the ESP32. The 16 byte header is followed by
+# `metadata_length` bytes of UTF-8 goober JSON (empty for a QR code), then the RGB565
+# bitmap (width * height * 2 bytes) and the transparency mask ((width + 7) // 8 * height bytes).
+# With a compressed encoding both sections are compressed separately; each one ends
+# once it has decoded to its full size. When the display already has the frame (see
+# X-Frame-Id), the encoding byte is SESSION_FRAME_OMITTED and the payload ends after the metadata.
+SESSION_MIMETYPE = 'application/octet-stream'
+SESSION_MAGIC = b'GOOB'
+SESSION_VERSION = 1
+SESSION_FRAME_OMITTED = 0xFF
+
+# magic, version, encoding, HTTP status, width, height, metadata length
+SESSION_HEADER = struct.Struct('<4sBBHHHI')
+
+def pack_session(status: int, frame: Frame, goober: dict = None, encoding: int = ENCODING_RAW, include_frame: bool = True):
+    metadata = current_app.json.dumps(goober).encode('utf-8') if goober is not None else b''
+    if not include_frame:
+        header = SESSION_HEADER.pack(SESSION_MAGIC, SESSION_VERSION, SESSION_FRAME_OMITTED, status, frame.width, frame.height, len(metadata))
+        return header + metadata
+    header = SESSION_HEADER.pack(SESSION_MAGIC, SESSION_VERSION, encoding, status, frame.width, frame.height, len(metadata))
+    return b''.join((header, metadata, frame.bitmap, frame.mask))
+
+def unpack_session(data: bytes):
+    magic, version, encoding, status, width, height, metadata_length = SESSION_HEADER.unpack_from(data)
+    if magic != SESSION_MAGIC or version != SESSION_VERSION:
+        raise ValueError('Not a version 1 session payload')
+    if encoding not in ENCODINGS.values() and encoding != SESSION_FRAME_OMITTED:
+        raise ValueError(f'Unsupported frame encoding {encoding}')
+
+    offset = SESSION_HEADER.size
+    metadata = data[offset:offset + metadata_length]
+    offset += metadata_length
+    if encoding == SESSION_FRAME_OMITTED:
+        return {'status': status, 'encoding': encoding, 'frame': None, 'goober': json.loads(metadata) if metadata else None}
+    bitmap, used = decompress_section(data[offset:], encoding, 2, width * height)
+    offset += used
+    mask, used = decompress_section(data[offset:], encoding, 1, (width + 7) // 8 * height)
+    return {
+        'status': status,
+        'encoding': encoding,
+        'frame': Frame(width, height, bitmap, mask),
+        'goober': json.loads(metadata) if metadata else None
+    }
@@ -0,0 +1,68 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from threading import BoundedSemaphore, Lock
+
+from app.imaging import render_frame, render_goober, render_qr
+
+class RenderUnavailable(Exception):
+    """Too many frames are already waiting to render, or this one took too long."""
+
+def qr_frame(url: str):
+    return render_frame(render_qr(url))
+
+def goober_frame(image_data: bytes):
+    return render_frame(render_goober(image_data))
+
+class RenderService:
+    """Runs frame rendering in worker processes so it doesn't hold a request thread's GIL.
+
+    At most max_pending renders can be queued or running per web worker; past that, and
+    for renders slower than timeout seconds, RenderUnavailable is raised. With workers=0
+    frames are rendered inline.
+    """
+
+    def __init__(self, workers: int, max_pending: int, timeout: float):
+        self.workers = workers
+        self.timeout = timeout
+        self._pending = BoundedSemaphore(max_pending)
+        self._executor = None
+        self._lock = Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn rather than fork: the web worker has threads and open db connections
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+            return self._executor
+
+    def _reset_executor(self, executor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def render(self, fn, *args):
+        if self.workers == 0:
+            return fn(*args)
+        if not self._pending.acquire(blocking=False):
+            raise RenderUnavailable('Too many frames waiting to render')
+
+        executor = self._get_executor()
+        try:
+            future = executor.submit(fn, *args)
+        except BrokenProcessPool as e:
+            self._pending.release()
+            self._reset_executor(executor)
+            raise RenderUnavailable('Render workers crashed') from e
+        # keep the slot until the render really finishes, even if we stop waiting for it
+        future.add_done_callback(lambda future: self._pending.release())
+
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError as e:
+            future.cancel()
+            raise RenderUnavailable('Rendering timed out') from e
+        except BrokenProcessPool as e:
+            self._reset_executor(executor)
+            raise RenderUnavailable('Render workers crashed') from e
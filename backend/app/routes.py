@@ -1,25 +1,83 @@
-import sys
-
-from app import app, version_blueprint
-from app.models import Goober, Fingerprint, CheckIn, Event, GooberHistory
-from flask import request, jsonify, render_template
+from app import version_blueprint
+from app.models import Goober, GooberFrame, GooberImage, Fingerprint, CheckIn, Event, CHECKIN_WINDOW, DEFAULT_STATION, event_catalog
+from app import rendering
+from app.imaging import Frame, normalize_goober
+from app.rendering import RenderService, RenderUnavailable
+from app.payload import SESSION_MIMETYPE, pack_session
+from app.compression import ENCODINGS, compress_frame
+from app.cache import FrameCache
+from app.feed import CheckInFeed, CurrentSession
+from app.metrics import image_timer
+from flask import current_app, request, jsonify, make_response, render_template
+from werkzeug.http import quote_etag
+from werkzeug.local import LocalProxy
 from app import db
-from datetime import datetime, timedelta
+from datetime import datetime
+import base64
+import binascii
 import hashlib
 import json
-import base64
-from PIL import Image
-import qrcode
-import io
+import math
+import time
+from typing import NamedTuple
+
+# per-app, created in init_app
+qr_frames: FrameCache = LocalProxy(lambda: current_app.extensions['qr_frames'])
+checkin_feed: CheckInFeed = LocalProxy(lambda: current_app.extensions['checkin_feed'])
+render_service: RenderService = LocalProxy(lambda: current_app.extensions['render_service'])
+
+def init_app(app):
+    app.extensions['qr_frames'] = FrameCache(maxsize=app.config['QR_FRAME_CACHE_SIZE'])
+    app.extensions['checkin_feed'] = CheckInFeed(ttl=app.config['STATION_SESSION_TTL'])
+    app.extensions['render_service'] = RenderService(app.config['RENDER_WORKERS'], app.config['RENDER_MAX_PENDING'], app.config['RENDER_TIMEOUT'])
+
+class InvalidArgument(Exception):
+    """A bad query argument, answered with a 400 and the message."""
+
+@version_blueprint.errorhandler(RenderUnavailable)
+def render_unavailable(e: RenderUnavailable):
+    return jsonify({'error': str(e)}), 503, {'Retry-After': '1'}
+
+@version_blueprint.errorhandler(InvalidArgument)
+def invalid_argument(e: InvalidArgument):
+    return jsonify({'error': str(e)}), 400
 
 @version_blueprint.route('/hello')
 def index():
     return 'Hello, World!'
 
+GOOBER_FIELDS = ('id', 'name', 'fingerprint', 'image')
+
+# The helpers below do everything for GET /goobers and GET /sessions except the db
+# calls, so this blueprint and the async server in app.async_reads answer the same way.
+
 @version_blueprint.route('/goobers', methods=['GET'])
 def get_goobers():
-    goobers = Goober.get_all()
-    return {'goobers': [{'name': goober.name, 'fingerprint': goober.fingerprint.fingerprint} for goober in goobers]}
+    after, limit, name, fields = goobers_args(request.args, current_app.config)
+    etag = goobers_etag(Goober.get_roster_version(), after, limit, name, fields)
+    if request.if_none_match.contains(etag):
+        return '', 304, {'ETag': quote_etag(etag)}
+    return goobers_response(Goober.get_page(after, limit, fields, name), etag, limit, fields)
+
+def goobers_args(args, config):
+    """after, limit, name and fields for a page of goobers, with limit clamped to the max page size."""
+    after: int = args.get('after', 0, type=int)
+    limit: int = args.get('limit', config['GOOBERS_PAGE_SIZE'], type=int)
+    name: str = args.get('name')
+    fields = args.get('fields', 'name,fingerprint').split(',')
+
+    if any(field not in GOOBER_FIELDS for field in fields):
+        raise InvalidArgument(f'fields must be a comma separated list of {", ".join(GOOBER_FIELDS)}')
+    return after, max(1, min(limit, config['GOOBERS_MAX_PAGE_SIZE'])), name, fields
+
+def goobers_etag(roster_version, after: int, limit: int, name: str, fields: list[str]):
+    return hashlib.sha1(repr((tuple(roster_version), after, limit, name, fields)).encode('utf-8')).hexdigest()
+
+def goobers_response(goobers: list[Goober], etag: str, limit: int, fields: list[str]):
+    return {
+        'goobers': [goober.to_fields(fields) for goober in goobers],
+        'next': goobers[-1].id if len(goobers) == limit else None
+    }, 200, {'ETag': quote_etag(etag)}
 
 @DeprecationWarning
 @version_blueprint.route('/goobers/<string:fingerprint>', methods=['GET'])
@@ -27,16 +85,9 @@ def get_goober_by_fingerprint(fingerprint: str):
     fingerprint_obj = Fingerprint.get_by_fingerprint(fingerprint)
     if not fingerprint_obj: 
         return jsonify({'error': 'Fingerprint not register not found'}), 404
-    goober = Goober.get_by_fingerprint(Fingerprint.get_by_fingerprint(fingerprint))
+    goober = Goober.get_by_fingerprint(fingerprint_obj)
     if not goober:
         return jsonify({'error': 'Goober not found'}), 404
-    
-    history = GooberHistory.get_by_fingerprint(goober_id=goober.id)
-
-    if not history or (datetime.now() - history[0].timestamp) > timedelta(days=6):
-        event: Event = Event.get_random_event()
-        db.session.add(GooberHistory(goober_id=goober.id, event_id=event.id, timestamp=datetime.now()))
-        db.session.commit()
 
     return jsonify(goober.to_json()), 200
 
@@ -59,61 +110,214 @@ def create_goober():
 
     return jsonify({'message': 'Goober created successfully', 'goober': {'name': new_goober.name, 'fingerprint': new_goober.fingerprint.fingerprint}}), 201
 
+def session_response(status: int, frame: Frame, goober_json: dict = None):
+    encoding_name, binary = session_args(request)
+    with image_timer():
+        frame_id = frame.frame_id()
+    reply = plan_session(request, status, frame_id, goober_json, encoding_name, binary)
+    if reply.not_modified:
+        return '', 304, reply.headers
+    with image_timer():
+        body = encode_session(status, frame, frame_id, goober_json, encoding_name, binary, reply.include_frame)
+    return session_reply(reply, status, body)
+
+class SessionReply(NamedTuple):
+    """How to answer a session request for one frame, worked out before anything is encoded."""
+    headers: dict
+    binary: bool
+    not_modified: bool
+    include_frame: bool
+
+def session_args(request):
+    """The frame encoding and whether the display wants the binary format."""
+    encoding_name = request.args.get('encoding', 'raw')
+    if encoding_name not in ENCODINGS:
+        raise InvalidArgument(f'Unsupported encoding, expected one of {", ".join(ENCODINGS)}')
+    return encoding_name, request.accept_mimetypes.best_match(['application/json', SESSION_MIMETYPE]) == SESSION_MIMETYPE
+
+def plan_session(request, status: int, frame_id: str, goober_json: dict, encoding_name: str, binary: bool):
+    include_frame = not has_frame(frame_id, request.if_none_match.as_set(), request.args.get('known_frame'))
+    # a display holding either body, with or without the frame, already has everything
+    etags = [session_etag(status, frame_id, goober_json, encoding_name, binary, included) for included in (True, False)]
+    matched = next((etag for etag in etags if request.if_none_match.contains(etag)), None)
+    etag = matched or etags[0 if include_frame else 1]
+    return SessionReply(
+        headers={'ETag': quote_etag(etag), 'X-Frame-Id': frame_id, 'Vary': 'Accept'},
+        binary=binary,
+        not_modified=matched is not None,
+        include_frame=include_frame,
+    )
+
+def session_reply(reply: SessionReply, status: int, body):
+    """The view's return value for an encode_session body; a dict body is sent as JSON."""
+    if reply.binary:
+        return body, status, {**reply.headers, 'Content-Type': SESSION_MIMETYPE}
+    return body, status, reply.headers
+
+def session_etag(status: int, frame_id: str, goober_json: dict, encoding_name: str, binary: bool, include_frame: bool = True):
+    """The frame id, then a hash of everything else in the session body, so a stale ETag still names the frame.
+
+    Bodies with and without the frame get different ETags, so a cache can't hand the frameless
+    one to a display that doesn't have the frame.
+    """
+    rest = hashlib.sha1(repr((status, goober_json, encoding_name, binary, include_frame)).encode('utf-8')).hexdigest()[:16]
+    return f'{frame_id}-{rest}'
+
+def has_frame(frame_id: str, etags: set[str], known_frame: str = None):
+    """Whether the display already holds this frame, going by ?known_frame= or an earlier session ETag."""
+    return known_frame == frame_id or any(etag.split('-')[0] == frame_id for etag in etags)
+
+def encode_session(status: int, frame: Frame, frame_id: str, goober_json: dict, encoding_name: str, binary: bool, include_frame: bool = True):
+    """The session body: packed bytes for binary clients, otherwise a dict to send as JSON."""
+    encoding = ENCODINGS[encoding_name]
+    if include_frame:
+        frame = compress_frame(frame, encoding)
+    if binary:
+        return pack_session(status, frame, goober_json, encoding, include_frame)
+
+    # without the frame, a display that already has it only needs the goober metadata
+    new_json = frame.to_json() if include_frame else {'width': frame.width, 'height': frame.height}
+    new_json['frame_id'] = frame_id
+    new_json['encoding'] = encoding_name
+    if goober_json is not None:
+        new_json['goober'] = goober_json
+    return new_json
+
+def valid_station_id(station_id) -> bool:
+    return isinstance(station_id, str) and 0 < len(station_id) <= 64
+
+def station_arg(args):
+    station_id: str = args.get('station_id', DEFAULT_STATION)
+    if not valid_station_id(station_id):
+        raise InvalidArgument('station_id must be 1 to 64 characters')
+    return station_id
+
+def current_session(station_id: str):
+    """The station's latest check-in, from this worker's feed when it's fresh enough and the db otherwise."""
+    session = checkin_feed.get(station_id)
+    if session is None:
+        checkin = CheckIn.get_latest(station_id)
+        if checkin is None:
+            return None
+        session = checkin.to_session()
+        checkin_feed.publish(station_id, session)
+    return session
+
 @version_blueprint.route('/sessions', methods=['GET'])
 def get_latest_session():
-    checkin = CheckIn.get_latest()
+    station_id = station_arg(request.args)
+    session = current_session(station_id)
     
-    if (not checkin or ((datetime.now() -checkin.timestamp) > timedelta(minutes=5))):
+    if (not session or ((datetime.now() - session.timestamp) > CHECKIN_WINDOW)):
         return jsonify({'error': 'No recent sessions found'}), 404
-    
-    goober = Goober.get_by_fingerprint(checkin.fingerprint)
+
+    return render_session(session)
+
+@version_blueprint.route('/sessions/next', methods=['GET'])
+def wait_for_session():
+    after: int = request.args.get('after', 0, type=int)
+    station_id = station_arg(request.args)
+    max_wait: float = current_app.config['SESSION_WAIT_TIMEOUT']
+    timeout = min(request.args.get('timeout', max_wait, type=float), max_wait)
+    deadline = time.monotonic() + timeout
+
+    while True:
+        session = current_session(station_id)
+        if session and session.id > after and (datetime.now() - session.timestamp) <= CHECKIN_WINDOW:
+            response = make_response(render_session(session))
+            response.headers['X-Checkin-Id'] = str(session.id)
+            return response
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return '', 204
+        # don't hold a pooled connection while we sleep
+        db.session.close()
+        # check-ins from other worker processes aren't published here, so re-check the db periodically
+        seen = max(after, session.id) if session else after
+        checkin_feed.wait(station_id, seen, min(remaining, current_app.config['SESSION_RECHECK_INTERVAL']))
+
+def render_session(session: CurrentSession):
+    goober = Goober.get_by_fingerprint_id(session.fingerprint_id)
     if (goober is None):
-        hash = hashlib.sha256((str(checkin.fingerprint) + str(checkin.timestamp)).encode('utf-8')).hexdigest()
-        url = f"https://goober.garden/v1/bubba-gum-shimp?access_token={hash}" 
-        img = qrcode.make(url)
-        img.save("qr.png")
-        rgba_img = img.convert("RGBA")
-
-        rgba_img.thumbnail([sys.maxsize, 480], Image.Resampling.LANCZOS)
-        return jsonify(png_to_json(rgba_img)), 201
+        qr_frame = qr_frames.get(session.access_token)
+        if qr_frame is None:
+            url = f"https://goober.garden/v1/bubba-gum-shimp?access_token={session.access_token}"
+            with image_timer():
+                qr_frame = render_service.render(rendering.qr_frame, url)
+            qr_frames.set(session.access_token, qr_frame, expires_at=session.timestamp + CHECKIN_WINDOW)
+        return session_response(201, qr_frame)
     else:
-        goober.go_on_adventure()
-        goober_json = goober.to_json()
-        img_64 = goober.image
-        # if "data:image/png;base64," in img_64:
-        #     img_64 = img_64.split("data:image/png;base64,")[1]
-        image_data = base64.b64decode(img_64)
-        image_buffer = io.BytesIO(image_data)
-        img = Image.open(image_buffer)
-        img.thumbnail([sys.maxsize, 360], Image.Resampling.LANCZOS)
-        # rgba_img = image_data.convert("RGBA")
-        new_json = png_to_json(img)
-        print(new_json)
-        del goober_json['image']
-        new_json['goober'] = goober_json
+        goober_json = goober.to_json(image=False)
+        stored = GooberFrame.get_by_goober(goober.id)
+        if stored is None:
+            # goobers from before frames were precomputed, or whose upload render failed, get rendered once here;
+            # two displays can get here at once, and both render the same frame
+            with image_timer():
+                frame = render_service.render(rendering.goober_frame, goober.image_blob.data)
+            GooberFrame.store(goober.id, frame)
+            db.session.commit()
+        else:
+            frame = stored.to_frame()
 
-        return jsonify(new_json), 200
+        return session_response(200, frame, goober_json)
 
 
 @version_blueprint.route('/sessions', methods=['POST'])
 def check_in_fingerprint():
     data = request.get_json()
     fingerprint: str = data.get('fingerprint')
+    station_id: str = data.get('station_id', DEFAULT_STATION)
 
     if not fingerprint:
         return jsonify({'error': 'Fingerprint is required'}), 400
+    if not valid_station_id(station_id):
+        return jsonify({'error': 'station_id must be 1 to 64 characters'}), 400
 
-    existing_fingerprint = Fingerprint.query.filter_by(fingerprint=fingerprint).first()
+    fingerprint_ids = Fingerprint.upsert([fingerprint])
+    new_checkin: CheckIn = CheckIn(fingerprint_id=fingerprint_ids[fingerprint], timestamp=datetime.now(), station_id=station_id)
+    db.session.add(new_checkin)
+    db.session.flush()
+    session = new_checkin.to_session()
+    db.session.commit()
+    checkin_feed.publish(station_id, session)
 
-    if not existing_fingerprint:
-        existing_fingerprint = Fingerprint(fingerprint=fingerprint)
-        db.session.add(existing_fingerprint)
+    return jsonify({'message': 'Check-in successful', 'fingerprint': fingerprint}), 201
 
-    new_checkin: CheckIn = CheckIn(fingerprint_id=db.session.query(Fingerprint).filter_by(fingerprint=fingerprint).first().id, timestamp=datetime.now())
-    db.session.add(new_checkin)
+@version_blueprint.route('/sessions/batch', methods=['POST'])
+def check_in_fingerprints():
+    data = request.get_json()
+    scans = data.get('checkins') if isinstance(data, dict) else data
+
+    default_station = data.get('station_id', DEFAULT_STATION) if isinstance(data, dict) else DEFAULT_STATION
+    if not isinstance(scans, list) or not scans:
+        return jsonify({'error': 'A list of check-ins is required'}), 400
+    if len(scans) > current_app.config['CHECKIN_BATCH_LIMIT']:
+        return jsonify({'error': f'At most {current_app.config["CHECKIN_BATCH_LIMIT"]} check-ins per batch'}), 400
+
+    checkins = []
+    for scan in scans:
+        fingerprint = scan.get('fingerprint') if isinstance(scan, dict) else None
+        if not fingerprint or not isinstance(fingerprint, str):
+            return jsonify({'error': 'Every check-in needs a fingerprint'}), 400
+        try:
+            timestamp = datetime.fromisoformat(scan['timestamp']) if scan.get('timestamp') else datetime.now()
+        except (TypeError, ValueError):
+            return jsonify({'error': f'Invalid timestamp {scan["timestamp"]!r}'}), 400
+        if timestamp.tzinfo is not None:
+            # check-in times are stored as naive local time, like datetime.now()
+            timestamp = timestamp.astimezone().replace(tzinfo=None)
+        station_id = scan.get('station_id', default_station)
+        if not valid_station_id(station_id):
+            return jsonify({'error': 'station_id must be 1 to 64 characters'}), 400
+        checkins.append({'fingerprint': fingerprint, 'timestamp': timestamp, 'station_id': station_id})
+
+    fingerprint_ids = Fingerprint.upsert([checkin['fingerprint'] for checkin in checkins])
+    checkin_ids = CheckIn.create_many([{'fingerprint_id': fingerprint_ids[checkin['fingerprint']], 'timestamp': checkin['timestamp'], 'station_id': checkin['station_id']} for checkin in checkins])
     db.session.commit()
+    checkin_feed.invalidate({checkin['station_id'] for checkin in checkins})
 
-    return jsonify({'message': 'Check-in successful', 'fingerprint': existing_fingerprint.fingerprint}), 201
+    return jsonify({'message': 'Check-ins successful', 'count': len(checkin_ids)}), 201
 
 @version_blueprint.route('/events', methods=['POST'])
 def create_event():
@@ -126,20 +330,25 @@ def create_event():
         valuestring: str = data.get('value_string')
     if type == 'float':
         valuefloat: float = data.get('value_float')
+    weight = data.get('weight', 1.0)
 
     if not name or not description:
         return jsonify({'error': 'Name, description, and timestamp are required'}), 400
+    # Flask's JSON parser accepts Infinity and NaN, which would take every pick
+    if isinstance(weight, bool) or not isinstance(weight, (int, float)) or not math.isfinite(weight) or weight < 0:
+        return jsonify({'error': 'Weight must be a finite non-negative number'}), 400
 
-    new_event: Event = Event(name=name, description=description, stat_name=stat_name, type=type, value_string=valuestring if type == 'str' else None, value_float=valuefloat if type == 'float' else None)
+    new_event: Event = Event(name=name, description=description, stat_name=stat_name, type=type, value_string=valuestring if type == 'str' else None, value_float=valuefloat if type == 'float' else None, weight=weight)
     db.session.add(new_event)
     db.session.commit()
+    event_catalog.invalidate()
 
     return jsonify({'message': 'Event created successfully', 'event': {'name': new_event.name, 'description': new_event.description}}), 201
 
 @version_blueprint.get('/gimme-new-one')
 def get_available_fingerprint():
-    fingerprint: str = Fingerprint.get_available_fingerprints()
-    if not fingerprint:
+    fingerprint: int = Fingerprint.get_available_fingerprints()
+    if fingerprint is None:
         return jsonify({'error': 'No available fingerprints'}), 404
     return str(fingerprint), 200
 
@@ -147,71 +356,52 @@ def get_available_fingerprint():
 def get_bubba_gum_shimp():
     return render_template('index.html')
 
-def rgb888_to_rgb565(red8, green8, blue8):
-    # Convert 8-bit red to 5-bit red.
-    red5 = round(red8 / 255 * 31)
-    # Convert 8-bit green to 6-bit green.
-    green6 = round(green8 / 255 * 63)
-    # Convert 8-bit blue to 5-bit blue.
-    blue5 = round(blue8 / 255 * 31)
-
-    # Shift the red value to the left by 11 bits.
-    red5_shifted = red5 << 11
-    # Shift the green value to the left by 5 bits.
-    green6_shifted = green6 << 5
-
-    # Combine the red, green, and blue values.
-    rgb565 = red5_shifted | green6_shifted | blue5
-
-    return rgb565
-
-def png_to_json(img):
-    bw = (img.width + 7) // 8
-    bitmap = [0] * img.width * img.height * 2
-    mask = [0] * bw * img.height
-
-    for y in range(img.height):
-        for x in range(img.width):
-            rgb8888 = img.getpixel((x, y))
-            if rgb8888[3] > 0:
-                mask[y * bw + x // 8] |= 1 << (7 - (x % 8))
-            rgb565 = rgb888_to_rgb565(rgb8888[0], rgb8888[1], rgb8888[2])
-            bitmap[y * img.width * 2 + x * 2] = rgb565 & 0xFF
-            bitmap[y * img.width * 2 + x * 2 + 1] = rgb565 >> 8
-        #     print(f"{x},{y}: {rgb8888} => {rgb565} => {bitmap[y * img.width + x * 2]} | {bitmap[y * img.width + x * 2 + 1]}")
-        #     if x % 8 == 7:
-        #         print(format(mask[y * bw + x // 8], "#010b"))
-        # print(format(mask[y * bw + x // 8], "#010b"))
-    bitmap_bytes = bytes(bitmap)
-    mask_bytes = bytes(mask)
-    return {"bitmap": base64.b64encode(bitmap_bytes).decode("utf-8"), "mask": base64.b64encode(mask_bytes).decode("utf-8"), "width": img.width, "height": img.height}
-
 @version_blueprint.post('/bubba-gum-shimp')
 def post_bubba_gum_shimp():
-    data = request.get_json()
+    # the drawing page uploads multipart/form-data; the older JSON body with a base64 image still works
+    if request.mimetype == 'multipart/form-data':
+        data = request.form
+        upload = request.files.get('image')
+        image_data = upload.read() if upload else None
+    else:
+        data = request.get_json()
+        try:
+            image_data = base64.b64decode(data.get('image') or '', validate=True)
+        except binascii.Error:
+            image_data = None
     name: str = data.get('name')
-    imageb64: str = data.get('image')
     access_token: str = data.get('access_token')
 
-    checkins = CheckIn.get_within_timeframe(5)
-    checkin = None
-    for c in checkins:
-        if hashlib.sha256((str(c.fingerprint) + str(c.timestamp)).encode('utf-8')).hexdigest() == access_token:
-            checkin = c
-            break
+    checkin = CheckIn.get_by_access_token(access_token) if access_token else None
 
     if not checkin:
         return jsonify({'error': 'Invalid access token'}), 403
-    
-    goober = Goober(name=name, image=imageb64, fingerprint_id=checkin.fingerprint.id)
+    if not name or not image_data:
+        return jsonify({'error': 'Name and image are required'}), 400
+
+    try:
+        with image_timer():
+            image_data = normalize_goober(image_data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    goober = Goober(name=name, image_blob=GooberImage.store(image_data), fingerprint_id=checkin.fingerprint.id)
     db.session.add(goober)
+    try:
+        with image_timer():
+            frame = render_service.render(rendering.goober_frame, image_data)
+        db.session.add(GooberFrame.from_frame(goober, frame))
+    except RenderUnavailable:
+        # don't lose the drawing; the frame gets rendered the first time the goober is shown
+        pass
     db.session.delete(checkin)
-    new_checkin = CheckIn(fingerprint_id=checkin.fingerprint.id, timestamp=datetime.now())
+    new_checkin = CheckIn(fingerprint_id=checkin.fingerprint.id, timestamp=datetime.now(), station_id=checkin.station_id)
     db.session.add(new_checkin)
+    db.session.flush()
+    session = new_checkin.to_session()
     db.session.commit()
+    checkin_feed.publish(new_checkin.station_id, session)
 
-    return 201
-
+    return jsonify({'message': 'Goober created successfully'}), 201
 
 
-app.register_blueprint(version_blueprint, url_prefix='/v1')
\ No newline at end of file
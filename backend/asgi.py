@@ -0,0 +1,4 @@
+from app.async_reads import app
+
+if __name__ == "__main__":
+    app.run()
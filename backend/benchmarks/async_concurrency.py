@@ -0,0 +1,128 @@
+"""Compare how the sync (gunicorn) and async (uvicorn) servers hold up under many slow displays.
+
+Seeds a scratch SQLite database, starts each server on it, then runs hundreds of simulated
+displays that read every response in small chunks with a pause between them, like the
+firmware does. Reports completed requests per second and latency at each concurrency.
+
+Run from the backend directory:
+    python -m benchmarks.async_concurrency --concurrency 50 200 500 --duration 15
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+DATABASE = os.path.join(tempfile.mkdtemp(), 'goobers.db')
+os.environ['DATABASE_URL'] = f'sqlite:///{DATABASE}'
+os.environ.setdefault('RENDER_WORKERS', '0')
+
+from app import create_app, db
+from benchmarks.suite import seed
+
+ENDPOINTS = {
+    'sessions': '/v1/sessions?encoding=rle',
+    'goobers': '/v1/goobers',
+}
+
+
+def servers(workers: int, threads: int, port: int):
+    return {
+        'sync gunicorn': ['gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:app'],
+        'async uvicorn': ['uvicorn', 'asgi:app', '--port', str(port), '--workers', str(workers), '--log-level', 'warning'],
+    }
+
+def start(command: list[str], workers: int, threads: int, port: int):
+    env = dict(os.environ, WEB_CONCURRENCY=str(workers), GUNICORN_THREADS=str(threads), GUNICORN_BIND=f'127.0.0.1:{port}',
+               GUNICORN_LOG_LEVEL='warning', STATION_SESSION_TTL='1')
+    process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/v1/goobers', timeout=1).read()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise SystemExit(f'{command[0]} did not start')
+
+async def slow_get(port: int, path: str, chunk: int, delay: float):
+    start = time.perf_counter()
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    try:
+        writer.write(f'GET {path} HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n'.encode())
+        await writer.drain()
+        status = int((await reader.readline()).split()[1])
+        while await reader.read(chunk):
+            await asyncio.sleep(delay)
+    finally:
+        writer.close()
+    return status, time.perf_counter() - start
+
+async def run_clients(port: int, path: str, concurrency: int, duration: float, chunk: int, delay: float):
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def display():
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            try:
+                status, latency = await slow_get(port, path, chunk, delay)
+            except (OSError, ValueError, IndexError):
+                errors += 1
+                await asyncio.sleep(0.1)
+                continue
+            if status == 200:
+                latencies.append(latency)
+            else:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(display() for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - start
+
+def check_in(app):
+    with app.app_context():
+        app.test_client().post('/v1/sessions', json={'fingerprint': str(app.config['FINGERPRINT_SLOTS'] + 1)})
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[50, 200, 500])
+    parser.add_argument('--duration', type=float, default=15)
+    parser.add_argument('--workers', type=int, default=2, help='Processes per server.')
+    parser.add_argument('--threads', type=int, default=4, help='Threads per gunicorn worker.')
+    parser.add_argument('--chunk', type=int, default=4096, help='Bytes a display reads at a time.')
+    parser.add_argument('--delay', type=float, default=0.002, help='Seconds a display waits between reads.')
+    parser.add_argument('--port', type=int, default=5055)
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        seed(goobers=200, events=50, history=20, deep_history=500, checkins=1000)
+
+    print(f'{"server":>14} {"endpoint":>9} {"clients":>8} {"req/s":>8} {"p50 ms":>8} {"p95 ms":>8} {"errors":>7}')
+    for name, command in servers(args.workers, args.threads, args.port).items():
+        process = start(command, args.workers, args.threads, args.port)
+        try:
+            for endpoint, path in ENDPOINTS.items():
+                for concurrency in args.concurrency:
+                    # keep the session inside CHECKIN_WINDOW however long the whole run takes
+                    check_in(app)
+                    latencies, errors, elapsed = asyncio.run(run_clients(args.port, path, concurrency, args.duration, args.chunk, args.delay))
+                    latencies.sort()
+                    p50 = statistics.median(latencies) * 1000 if latencies else float('nan')
+                    p95 = latencies[int(len(latencies) * 0.95)] * 1000 if latencies else float('nan')
+                    print(f'{name:>14} {endpoint:>9} {concurrency:>8} {len(latencies) / elapsed:>8.1f} {p50:>8.1f} {p95:>8.1f} {errors:>7}')
+                    sys.stdout.flush()
+        finally:
+            process.terminate()
+            process.wait()
+
+if __name__ == '__main__':
+    main()
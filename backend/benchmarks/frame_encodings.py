@@ -0,0 +1,34 @@
+"""Report bytes on the wire and encode time for each session frame encoding.
+
+Run from the backend directory: python -m benchmarks.frame_encodings
+"""
+import base64
+import os
+import timeit
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from app import create_app
+from app.compression import ENCODINGS, compress_frame
+from app.imaging import render_frame
+from app.payload import pack_session, unpack_session
+from benchmarks.png_to_json import goober_image, noise_image, qr_image
+
+
+def main():
+    frames = {'qr': render_frame(qr_image()), 'goober': render_frame(goober_image()), 'noise': render_frame(noise_image(333, 257))}
+    print(f'{"image":>6} {"encoding":>8} {"binary bytes":>13} {"base64 bytes":>13} {"encode ms":>10}')
+    with create_app().app_context():
+        for name, frame in frames.items():
+            for encoding_name, encoding in ENCODINGS.items():
+                compressed = compress_frame(frame, encoding)
+                packed = pack_session(200, compressed, encoding=encoding)
+                if unpack_session(packed)['frame'] != frame:
+                    raise SystemExit(f'{name}: {encoding_name} does not round-trip')
+
+                json_bytes = len(base64.b64encode(compressed.bitmap)) + len(base64.b64encode(compressed.mask))
+                encode_time = min(timeit.repeat(lambda: compress_frame(frame, encoding), number=5, repeat=3)) / 5
+                print(f'{name:>6} {encoding_name:>8} {len(packed):>13} {json_bytes:>13} {encode_time * 1000:>10.2f}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""Fail if starting the app imports the imaging libraries or takes longer than a budget.
+
+Runs `python -X importtime` on importing the app package and on building an app with
+create_app(), which is what every gunicorn worker, flask command and migration does.
+numpy, PIL and qrcode should only load once a frame is rendered, and prometheus_client
+only when METRICS_ENABLED is set.
+
+Run from the backend directory: python -m benchmarks.import_time [--budget-ms N] [--top N]
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+STARTUPS = {
+    'import app': 'import app',
+    'create_app()': 'from app import create_app; create_app()',
+}
+LAZY_MODULES = ('numpy', 'PIL', 'qrcode', 'prometheus_client')
+
+def import_times(code: str):
+    """Each module the code imports, mapped to (self, cumulative) microseconds."""
+    env = {name: value for name, value in os.environ.items() if name != 'METRICS_ENABLED'}
+    env.setdefault('DATABASE_URL', 'sqlite://')
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise SystemExit(result.stderr)
+
+    modules = {}
+    for line in result.stderr.splitlines():
+        # import time:       self [us] |  cumulative | imported package
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return modules
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--budget-ms', type=float, default=1000, help='Most a startup may spend importing.')
+    parser.add_argument('--top', type=int, default=10, help='How many of the slowest modules to list.')
+    args = parser.parse_args()
+
+    failed = False
+    for name, code in STARTUPS.items():
+        modules = import_times(code)
+        total_ms = sum(self_us for self_us, _ in modules.values()) / 1000
+        loaded = sorted({module.split('.')[0] for module in modules} & set(LAZY_MODULES))
+        problems = [f'imports {", ".join(loaded)}'] if loaded else []
+        if total_ms > args.budget_ms:
+            problems.append(f'over the {args.budget_ms:.0f} ms budget')
+
+        print(f'{"FAIL" if problems else "ok":>4}  {name}: {total_ms:.1f} ms in {len(modules)} modules{" - " + "; ".join(problems) if problems else ""}')
+        for module, (self_us, cumulative_us) in sorted(modules.items(), key=lambda item: -item[1][1])[:args.top]:
+            print(f'{"":>6}{cumulative_us / 1000:8.1f} ms  {module}')
+        failed = failed or bool(problems)
+    if failed:
+        raise SystemExit('Startup is importing more than it should')
+
+if __name__ == '__main__':
+    main()
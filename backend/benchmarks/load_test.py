@@ -0,0 +1,102 @@
+"""Hammer a running server and report requests per second and latency for each endpoint.
+
+Start the server the way production does, e.g.
+    DATABASE_URL=... gunicorn -c gunicorn.conf.py wsgi:app
+then run from the backend directory:
+    python -m benchmarks.load_test --url http://localhost:5000 --concurrency 32 --duration 20
+
+With --fingerprint the script checks that fingerprint in first, so /v1/sessions has a
+session to render instead of answering 404.
+"""
+import argparse
+import json
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+
+ENDPOINTS = {
+    'hello': ('/v1/hello', {}),
+    'goobers': ('/v1/goobers', {}),
+    'sessions json': ('/v1/sessions', {}),
+    'sessions binary': ('/v1/sessions', {'Accept': 'application/octet-stream'}),
+    'sessions binary rle': ('/v1/sessions?encoding=rle', {'Accept': 'application/octet-stream'}),
+}
+
+
+def request(url: str, headers: dict):
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=30) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        e.read()
+        status = e.code
+    except OSError:
+        status = None
+    return status, time.perf_counter() - start
+
+def run_endpoint(base_url: str, path: str, headers: dict, concurrency: int, duration: float):
+    latencies = []
+    statuses = defaultdict(int)
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker():
+        while time.perf_counter() < deadline:
+            status, latency = request(base_url + path, headers)
+            with lock:
+                latencies.append(latency)
+                statuses[status] += 1
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return latencies, dict(statuses), elapsed
+
+def percentile(values: list, fraction: float):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', default='http://localhost:5000')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10, help='Seconds per endpoint.')
+    parser.add_argument('--fingerprint', help='Check this fingerprint in before testing /v1/sessions.')
+    parser.add_argument('--endpoints', nargs='*', choices=list(ENDPOINTS), default=list(ENDPOINTS))
+    parser.add_argument('--json', dest='json_path', help='Also write the results to this file.')
+    args = parser.parse_args()
+
+    if args.fingerprint:
+        body = json.dumps({'fingerprint': args.fingerprint}).encode('utf-8')
+        urllib.request.urlopen(urllib.request.Request(args.url + '/v1/sessions', data=body, headers={'Content-Type': 'application/json'}))
+
+    results = {}
+    print(f'{"endpoint":>20} {"requests":>9} {"req/s":>8} {"p50 ms":>8} {"p99 ms":>8}  statuses')
+    for name in args.endpoints:
+        path, headers = ENDPOINTS[name]
+        latencies, statuses, elapsed = run_endpoint(args.url, path, headers, args.concurrency, args.duration)
+        results[name] = {
+            'requests': len(latencies),
+            'rps': len(latencies) / elapsed,
+            'p50_ms': statistics.median(latencies) * 1000,
+            'p99_ms': percentile(latencies, 0.99) * 1000,
+            'statuses': {str(status): count for status, count in statuses.items()},
+        }
+        result = results[name]
+        print(f'{name:>20} {result["requests"]:>9} {result["rps"]:>8.1f} {result["p50_ms"]:>8.1f} {result["p99_ms"]:>8.1f}  {statuses}')
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump({'url': args.url, 'concurrency': args.concurrency, 'duration': args.duration, 'results': results}, f, indent=2)
+
+if __name__ == '__main__':
+    main()
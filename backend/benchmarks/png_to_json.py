@@ -0,0 +1,73 @@
+"""Compare the vectorized png_to_json against the original per-pixel loop.
+
+Run from the backend directory: python -m benchmarks.png_to_json
+"""
+import base64
+import io
+import os
+import random
+import sys
+import timeit
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+import qrcode
+from PIL import Image, ImageDraw
+
+from app.imaging import png_to_json, rgb888_to_rgb565
+
+
+def png_to_json_loop(img):
+    # The original per-pixel encoder, kept as the reference output.
+    bw = (img.width + 7) // 8
+    bitmap = [0] * img.width * img.height * 2
+    mask = [0] * bw * img.height
+
+    for y in range(img.height):
+        for x in range(img.width):
+            rgb8888 = img.getpixel((x, y))
+            if rgb8888[3] > 0:
+                mask[y * bw + x // 8] |= 1 << (7 - (x % 8))
+            rgb565 = rgb888_to_rgb565(rgb8888[0], rgb8888[1], rgb8888[2])
+            bitmap[y * img.width * 2 + x * 2] = rgb565 & 0xFF
+            bitmap[y * img.width * 2 + x * 2 + 1] = rgb565 >> 8
+    bitmap_bytes = bytes(bitmap)
+    mask_bytes = bytes(mask)
+    return {"bitmap": base64.b64encode(bitmap_bytes).decode("utf-8"), "mask": base64.b64encode(mask_bytes).decode("utf-8"), "width": img.width, "height": img.height}
+
+def qr_image():
+    img = qrcode.make("https://goober.garden/v1/bubba-gum-shimp?access_token=" + "f" * 64).convert("RGBA")
+    img.thumbnail([sys.maxsize, 480], Image.Resampling.LANCZOS)
+    return img
+
+def goober_image():
+    # Something shaped like a canvas drawing: flat strokes on a transparent background.
+    rng = random.Random(0)
+    img = Image.new("RGBA", (600, 600), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(img)
+    for _ in range(40):
+        points = [(rng.randrange(600), rng.randrange(600)) for _ in range(4)]
+        draw.line(points, fill=(rng.randrange(256), rng.randrange(256), rng.randrange(256), 255), width=8)
+    buffer = io.BytesIO()
+    img.save(buffer, format="PNG")
+    img = Image.open(io.BytesIO(buffer.getvalue()))
+    img.thumbnail([sys.maxsize, 360], Image.Resampling.LANCZOS)
+    return img
+
+def noise_image(width, height):
+    # Every channel value and odd widths, to exercise rounding and mask padding.
+    return Image.frombytes("RGBA", (width, height), random.Random(1).randbytes(width * height * 4))
+
+def main():
+    images = {'qr': qr_image(), 'goober': goober_image(), 'noise': noise_image(333, 257)}
+    for name, img in images.items():
+        if png_to_json(img) != png_to_json_loop(img):
+            raise SystemExit(f'{name}: vectorized output differs from the per-pixel loop')
+
+        loop_time = min(timeit.repeat(lambda: png_to_json_loop(img), number=1, repeat=3))
+        vector_time = min(timeit.repeat(lambda: png_to_json(img), number=5, repeat=3)) / 5
+        print(f'{name:>6} {img.width}x{img.height}: loop {loop_time * 1000:8.1f} ms  '
+              f'vectorized {vector_time * 1000:6.2f} ms  ({loop_time / vector_time:.0f}x)')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""Fail if a goober read sends more SQL statements as the tables grow.
+
+Seeds two throwaway SQLite databases, one with ten times the goobers and history
+rows of the other, counts the statements each read sends on both, and fails if
+any count differs. A lazy load inside a loop shows up as a count that grows.
+
+Run from the backend directory: python -m benchmarks.query_counts [--goobers N] [--history N]
+"""
+import argparse
+import os
+from contextlib import contextmanager
+
+os.environ['DATABASE_URL'] = 'sqlite://'
+
+import sqlalchemy as sa
+
+from app import create_app, db
+from app.models import Goober
+from benchmarks.query_plans import seed
+
+
+@contextmanager
+def counted_statements():
+    statements = []
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    sa.event.listen(db.engine, 'before_cursor_execute', count)
+    try:
+        yield statements
+    finally:
+        sa.event.remove(db.engine, 'before_cursor_execute', count)
+
+def reads(client):
+    return {
+        'GET /v1/goobers': lambda: client.get('/v1/goobers?fields=id,name,fingerprint,image&limit=500'),
+        'GET /v1/goobers?name=': lambda: client.get('/v1/goobers?fields=id,name,fingerprint&name=goober 1'),
+        'Goober.to_json': lambda: db.session.get(Goober, 1).to_json(),
+    }
+
+def statement_counts(goobers: int, history: int):
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        seed(goobers, history)
+        counts = {}
+        for name, read in reads(app.test_client()).items():
+            db.session.expire_all()
+            with counted_statements() as statements:
+                read()
+            counts[name] = len(statements)
+        db.drop_all()
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--goobers', type=int, default=100)
+    parser.add_argument('--history', type=int, default=10, help='History rows per goober.')
+    args = parser.parse_args()
+
+    small = statement_counts(args.goobers, args.history)
+    large = statement_counts(args.goobers * 10, args.history * 10)
+    failed = False
+    for name in small:
+        ok = small[name] == large[name]
+        print(f'{"ok" if ok else "FAIL":>4}  {name}: {small[name]} statements at {args.goobers} goobers, {large[name]} at {args.goobers * 10}')
+        failed = failed or not ok
+    if failed:
+        raise SystemExit('Some goober reads send more statements as the tables grow')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""Fail if a hot-path query falls back to a full table scan or an unindexed sort.
+
+Seeds a throwaway SQLite database, runs each hot query through the models while
+recording the SQL they send, then checks EXPLAIN QUERY PLAN for every statement.
+
+Run from the backend directory: python -m benchmarks.query_plans [--goobers N]
+"""
+import argparse
+import os
+import random
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+os.environ['DATABASE_URL'] = 'sqlite://'
+
+import sqlalchemy as sa
+
+from app import create_app, db
+from app.models import CheckIn, Event, Fingerprint, FingerprintSlot, Goober, GooberHistory, GooberImage, GooberSummary
+from app.adventures import run_adventures
+
+# Tables each query is allowed to scan. The adventure scheduler checks every goober and
+# reloads the (small, cached) event catalog on purpose.
+ALLOWED_SCANS = {
+    'run_adventures': {'goobers', 'goober_summaries', 'events'},
+}
+
+
+def seed(goobers: int, history_per_goober: int):
+    rng = random.Random(0)
+    now = datetime.now()
+    db.session.execute(sa.insert(Event), [
+        {'name': f'event {i}', 'description': 'd', 'stat_name': 's', 'type': 'float', 'value_float': i, 'weight': 1.0}
+        for i in range(50)
+    ])
+    db.session.execute(sa.insert(Fingerprint), [{'fingerprint': str(i)} for i in range(goobers * 2)])
+    db.session.execute(sa.insert(GooberImage), [{'sha256': '0' * 64, 'data': b''}])
+    db.session.execute(sa.insert(Goober), [{'name': f'goober {i}', 'fingerprint_id': i + 1, 'image_sha256': '0' * 64} for i in range(goobers)])
+    db.session.execute(sa.insert(GooberHistory), [
+        {'goober_id': goober_id, 'event_id': rng.randrange(1, 51), 'timestamp': now - timedelta(minutes=rng.randrange(100000))}
+        for goober_id in range(1, goobers + 1) for _ in range(history_per_goober)
+    ])
+    db.session.execute(sa.insert(CheckIn), [
+        {'fingerprint_id': rng.randrange(1, goobers * 2 + 1), 'timestamp': now - timedelta(minutes=rng.randrange(100000)), 'access_token': f'{i:064x}', 'station_id': f'station {i % 4}'}
+        for i in range(goobers * 5)
+    ])
+    for goober_id in range(1, goobers + 1):
+        GooberSummary.rebuild(goober_id)
+    db.session.commit()
+    db.session.execute(sa.text('ANALYZE'))
+
+@contextmanager
+def recorded_statements():
+    statements = []
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT') and not executemany:
+            statements.append((statement, parameters))
+    sa.event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        sa.event.remove(db.engine, 'before_cursor_execute', record)
+
+def hot_queries():
+    fingerprint = Fingerprint.get_by_fingerprint('7')
+    goober = Goober.get_by_fingerprint(fingerprint)
+    goober_id = goober.id
+    # the first reservation creates the slot rows; check the one every later enrollment runs
+    FingerprintSlot.reserve()
+    return {
+        'Fingerprint.get_by_fingerprint': lambda: Fingerprint.get_by_fingerprint('7'),
+        'Goober.get_by_fingerprint': lambda: Goober.get_by_fingerprint(fingerprint),
+        'Goober.get_page': lambda: Goober.get_page(100, 50, ['id', 'name', 'fingerprint']),
+        'Goober.to_json': lambda: goober.to_json(),
+        'Goober.get_page name': lambda: Goober.get_page(0, 50, ['id', 'name'], name='goober 7'),
+        'GooberSummary.get_by_goober': lambda: GooberSummary.get_by_goober(goober_id),
+        'FingerprintSlot.reserve': FingerprintSlot.reserve,
+        'CheckIn.get_latest': lambda: CheckIn.get_latest('station 2'),
+        'CheckIn.get_by_access_token': lambda: CheckIn.get_by_access_token(f'{7:064x}'),
+        'run_adventures': lambda: (run_adventures(), db.session.rollback()),
+    }
+
+def plan_problems(name: str, statement: str, parameters):
+    problems = []
+    plan = db.session.connection().exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).all()
+    for row in plan:
+        detail = row[-1]
+        words = detail.split()
+        # "SEARCH" seeks into an index; "SCAN" reads the whole table or index
+        if words[0] == 'SCAN' and words[1] not in ALLOWED_SCANS.get(name, set()):
+            problems.append(detail)
+        if 'TEMP B-TREE' in detail and 'ORDER BY' in detail:
+            problems.append(detail)
+    return problems, plan
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--goobers', type=int, default=2000)
+    parser.add_argument('--history', type=int, default=10, help='History rows per goober.')
+    args = parser.parse_args()
+
+    failed = False
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        seed(args.goobers, args.history)
+        for name, query in hot_queries().items():
+            db.session.expire_all()
+            with recorded_statements() as statements:
+                query()
+            for statement, parameters in statements:
+                problems, plan = plan_problems(name, statement, parameters)
+                print(f'{"FAIL" if problems else "ok":>4}  {name}: {" / ".join(row[-1] for row in plan)}')
+                failed = failed or bool(problems)
+    if failed:
+        raise SystemExit('Some hot queries are not using an index')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""Fail if the binary session payload doesn't carry the same session as the JSON route.
+
+Seeds a throwaway SQLite database, checks in an enrolled fingerprint (goober session)
+and an unenrolled one (QR session), then fetches GET /v1/sessions as JSON and as
+application/octet-stream in every encoding. unpack_session has to give back the same
+status, frame and goober JSON, the frame has to match X-Frame-Id, and with
+?known_frame= the frame has to be left out of both formats.
+
+Run from the backend directory: python -m benchmarks.session_payloads
+"""
+import base64
+import os
+
+os.environ['DATABASE_URL'] = 'sqlite://'
+os.environ.setdefault('RENDER_WORKERS', '0')
+
+from flask import current_app
+
+from app import create_app, db
+from app.compression import ENCODINGS, decompress_section
+from app.imaging import Frame
+from app.payload import SESSION_FRAME_OMITTED, SESSION_MIMETYPE, unpack_session
+from benchmarks.suite import seed
+
+BINARY = {'Accept': SESSION_MIMETYPE}
+
+
+def json_frame(body: dict, encoding: int):
+    """The frame in a JSON session body, decompressed like the display would."""
+    width, height = body['width'], body['height']
+    bitmap, _ = decompress_section(base64.b64decode(body['bitmap']), encoding, 2, width * height)
+    mask, _ = decompress_section(base64.b64decode(body['mask']), encoding, 1, (width + 7) // 8 * height)
+    return Frame(width, height, bitmap, mask)
+
+def session_problems(client, fingerprint: str, status: int):
+    problems = []
+    def expect(ok: bool, problem: str):
+        if not ok:
+            problems.append(problem)
+
+    client.post('/v1/sessions', json={'fingerprint': fingerprint})
+    for encoding_name, encoding in ENCODINGS.items():
+        as_json = client.get(f'/v1/sessions?encoding={encoding_name}')
+        as_binary = client.get(f'/v1/sessions?encoding={encoding_name}', headers=BINARY)
+        expect(as_json.status_code == as_binary.status_code == status, f'{encoding_name}: status {as_json.status_code}/{as_binary.status_code}, expected {status}')
+        expect(as_binary.mimetype == SESSION_MIMETYPE, f'{encoding_name}: binary response is {as_binary.mimetype}')
+
+        body = as_json.get_json()
+        payload = unpack_session(as_binary.data)
+        frame = json_frame(body, encoding)
+        frame_id = as_json.headers['X-Frame-Id']
+        expect(payload['status'] == status, f'{encoding_name}: payload status {payload["status"]}')
+        expect(payload['encoding'] == encoding, f'{encoding_name}: payload encoding {payload["encoding"]}')
+        expect(payload['frame'] == frame, f'{encoding_name}: binary frame differs from the JSON one')
+        expect(frame.frame_id() == frame_id == body['frame_id'], f'{encoding_name}: frame does not match X-Frame-Id')
+        expect(payload['goober'] == body.get('goober'), f'{encoding_name}: binary goober JSON differs from the JSON one')
+
+        known_json = client.get(f'/v1/sessions?encoding={encoding_name}&known_frame={frame_id}')
+        known_binary = client.get(f'/v1/sessions?encoding={encoding_name}&known_frame={frame_id}', headers=BINARY)
+        known_body = known_json.get_json()
+        known_payload = unpack_session(known_binary.data)
+        expect('bitmap' not in known_body and (known_body['width'], known_body['height']) == (frame.width, frame.height), f'{encoding_name}: known frame still sent as JSON')
+        expect(known_payload['encoding'] == SESSION_FRAME_OMITTED and known_payload['frame'] is None, f'{encoding_name}: known frame still sent as binary')
+        expect(known_payload['status'] == status and known_payload['goober'] == known_body.get('goober') == body.get('goober'), f'{encoding_name}: known frame session differs')
+    return problems
+
+def main():
+    app = create_app()
+    failed = False
+    with app.app_context():
+        db.create_all()
+        seed(goobers=5, events=10, history=5, deep_history=60, checkins=10)
+        offset = current_app.config['FINGERPRINT_SLOTS'] + 1
+        client = app.test_client()
+        # seed gives goobers to the first half of the fingerprints above the last slot
+        for name, fingerprint, status in (('goober', str(offset), 200), ('qr', str(offset + 9), 201)):
+            problems = session_problems(client, fingerprint, status)
+            print(f'{"FAIL" if problems else "ok":>4}  {name} session: {"; ".join(problems) or "JSON and binary match in " + ", ".join(ENCODINGS)}')
+            failed = failed or bool(problems)
+    if failed:
+        raise SystemExit('The binary session payload does not match the JSON route')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+"""Time the backend hot paths against a seeded database and save the results as JSON.
+
+Run from the backend directory:
+    python -m benchmarks.suite --output bench.json
+    python -m benchmarks.suite --compare bench.json
+
+Uses an in-memory SQLite database unless DATABASE_URL is set; point it at a scratch
+Postgres database (the tables are created and filled) to time the production dialect.
+Every run is seeded the same way, so two result files from different commits with the
+same volumes can be compared with --compare.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import time
+from datetime import datetime, timedelta
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+# render inline so worker start-up doesn't land in the first timed request
+os.environ.setdefault('RENDER_WORKERS', '0')
+
+import sqlalchemy as sa
+from flask import current_app
+
+from app import create_app, db
+from app.imaging import normalize_goober, png_to_json
+from app.models import CheckIn, Event, Fingerprint, FingerprintSlot, Goober, GooberFrame, GooberHistory, GooberImage, GooberSummary
+from benchmarks.png_to_json import goober_image, qr_image
+
+
+def seed(goobers: int, events: int, history: int, deep_history: int, checkins: int):
+    """Fill the database and return the goober with the deep history."""
+    rng = random.Random(0)
+    now = datetime.now()
+    db.session.execute(sa.insert(Event), [
+        {'name': f'event {i}', 'description': 'd', 'stat_name': 's', 'type': 'float', 'value_float': i, 'weight': 1.0}
+        for i in range(events)
+    ])
+    # fingerprints above the last slot, so the allocator sees every slot as free
+    offset = current_app.config['FINGERPRINT_SLOTS'] + 1
+    db.session.execute(sa.insert(Fingerprint), [{'fingerprint': str(offset + i)} for i in range(goobers * 2)])
+    image = GooberImage.store(normalize_goober(png_bytes(goober_image())))
+    db.session.add(image)
+    db.session.flush()
+    db.session.execute(sa.insert(Goober), [{'name': f'goober {i}', 'fingerprint_id': i + 1, 'image_sha256': image.sha256} for i in range(goobers)])
+    db.session.execute(sa.insert(GooberHistory), [
+        {'goober_id': goober_id, 'event_id': rng.randrange(1, events + 1), 'timestamp': now - timedelta(minutes=rng.randrange(100000))}
+        for goober_id in range(1, goobers + 1) for _ in range(deep_history if goober_id == 1 else history)
+    ])
+    db.session.execute(sa.insert(CheckIn), [
+        {'fingerprint_id': rng.randrange(1, goobers * 2 + 1), 'timestamp': now - timedelta(days=1, minutes=rng.randrange(100000)), 'access_token': f'{i:064x}'}
+        for i in range(checkins)
+    ])
+    for goober_id in range(1, goobers + 1):
+        GooberSummary.rebuild(goober_id)
+    goober = db.session.get(Goober, 1)
+    db.session.add(GooberFrame.render(goober))
+    db.session.commit()
+    return goober
+
+def png_bytes(img):
+    buffer = io.BytesIO()
+    img.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+def check_in(fingerprint: Fingerprint):
+    checkin = CheckIn(fingerprint_id=fingerprint.id, timestamp=datetime.now())
+    db.session.add(checkin)
+    db.session.commit()
+    return checkin
+
+def release_slots():
+    db.session.execute(sa.update(FingerprintSlot).values(reserved_until=None))
+    db.session.commit()
+
+def measure(fn, repeat: int, setup=None):
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return {
+        'runs': repeat,
+        'min_ms': times[0] * 1000,
+        'median_ms': statistics.median(times) * 1000,
+        'mean_ms': statistics.fmean(times) * 1000,
+        'p95_ms': times[min(len(times) - 1, int(len(times) * 0.95))] * 1000,
+    }
+
+def expect(response, status: int):
+    if response.status_code != status:
+        raise SystemExit(f'{response.request.path} returned {response.status_code}, expected {status}')
+
+def benchmarks(goober: Goober):
+    client = current_app.test_client()
+    images = {'qr': qr_image(), 'goober': goober_image()}
+    enrolled = goober.fingerprint
+    unenrolled = db.session.get(Fingerprint, 2 * db.session.scalar(sa.select(sa.func.count(Goober.id))))
+    token = check_in(enrolled).access_token
+
+    def session(fingerprint: Fingerprint, status: int, **headers):
+        def setup():
+            # through the route, so this worker's per-station session map sees it like a real scan
+            expect(client.post('/v1/sessions', json={'fingerprint': fingerprint.fingerprint}), 201)
+            db.session.expire_all()
+        def run():
+            expect(client.get('/v1/sessions', headers=headers), status)
+        return run, setup
+
+    yield 'png_to_json qr', (lambda: png_to_json(images['qr'])), None
+    yield 'png_to_json goober', (lambda: png_to_json(images['goober'])), None
+    yield 'Goober.to_json deep history', (lambda: goober.to_json()), db.session.expire_all
+    yield 'Fingerprint.get_available_fingerprints', Fingerprint.get_available_fingerprints, release_slots
+    yield 'CheckIn.get_by_access_token', (lambda: CheckIn.get_by_access_token(token)), db.session.expire_all
+    yield 'POST /v1/bubba-gum-shimp bad token', (lambda: expect(client.post('/v1/bubba-gum-shimp', json={'access_token': 'f' * 64, 'name': 'x', 'image': 'x'}), 403)), None
+    yield 'POST /v1/bubba-gum-shimp no token', (lambda: expect(client.post('/v1/bubba-gum-shimp', json={'name': 'x', 'image': 'x'}), 403)), None
+    yield 'GET /v1/goobers', (lambda: expect(client.get('/v1/goobers'), 200)), None
+    yield 'GET /v1/goobers?fields=id,name', (lambda: expect(client.get('/v1/goobers?fields=id,name'), 200)), None
+    yield 'GET /v1/sessions goober json', *session(enrolled, 200)
+    yield 'GET /v1/sessions goober binary', *session(enrolled, 200, Accept='application/octet-stream')
+    frame_id = client.get('/v1/sessions').headers['X-Frame-Id']
+    yield 'GET /v1/sessions goober known frame', *session(enrolled, 200, Accept='application/octet-stream', **{'If-None-Match': f'"{frame_id}-"'})
+    yield 'GET /v1/sessions qr json', *session(unenrolled, 201)
+    yield 'GET /v1/sessions qr binary', *session(unenrolled, 201, Accept='application/octet-stream')
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results: dict, baseline_path: str):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f'\nagainst {baseline_path} ({baseline["commit"]}):')
+    for name, result in results.items():
+        before = baseline['results'].get(name)
+        if before is None:
+            print(f'{name:>40}  new')
+            continue
+        change = result['median_ms'] / before['median_ms'] - 1
+        print(f'{name:>40}  {before["median_ms"]:9.3f} -> {result["median_ms"]:9.3f} ms  {change:+7.1%}')
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--goobers', type=int, default=1000)
+    parser.add_argument('--events', type=int, default=50)
+    parser.add_argument('--history', type=int, default=20, help='History rows per goober.')
+    parser.add_argument('--deep-history', type=int, default=5000, help='History rows for the goober timed in to_json and /v1/sessions.')
+    parser.add_argument('--checkins', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--output', help='Write the results to this JSON file.')
+    parser.add_argument('--compare', help='A previous --output file to compare medians against.')
+    args = parser.parse_args()
+
+    results = {}
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        goober = seed(args.goobers, args.events, args.history, args.deep_history, args.checkins)
+        for name, fn, setup in benchmarks(goober):
+            # warm caches the way a running server would have them
+            if setup is not None:
+                setup()
+            fn()
+            results[name] = measure(fn, args.repeat, setup)
+            print(f'{name:>40}  median {results[name]["median_ms"]:9.3f} ms  p95 {results[name]["p95_ms"]:9.3f} ms')
+        dialect = db.engine.dialect.name
+
+    if args.compare:
+        compare(results, args.compare)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'commit': git_commit(),
+                'created': datetime.now().isoformat(timespec='seconds'),
+                'python': platform.python_version(),
+                'database': dialect,
+                'params': {name: value for name, value in vars(args).items() if name not in ('output', 'compare')},
+                'results': results,
+            }, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,30 @@
+# Production serving profile: gunicorn -c gunicorn.conf.py wsgi:app
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND') or '0.0.0.0:5000'
+
+# threaded workers so a slow display download or a /v1/sessions/next long-poll only
+# ties up one thread, not a whole process
+worker_class = 'gthread'
+workers = int(os.environ.get('WEB_CONCURRENCY') or multiprocessing.cpu_count() * 2 + 1)
+threads = int(os.environ.get('GUNICORN_THREADS') or 4)
+
+# Every worker also gets its own pool of RENDER_WORKERS render processes. Unless that's
+# set, config.py gives each pool cores // WEB_CONCURRENCY processes (at least one), so
+# with the default worker count above that's one per worker. Exported here so the
+# workers see the count even when it came from the default. The reads service's uvicorn
+# workers each have a pool too; set RENDER_WORKERS lower if both run on one host.
+os.environ['WEB_CONCURRENCY'] = str(workers)
+
+# has to outlast SESSION_WAIT_TIMEOUT long-polls
+timeout = int(os.environ.get('GUNICORN_TIMEOUT') or 60)
+graceful_timeout = 30
+keepalive = 5
+
+# recycle workers now and then so a leak in PIL or the pool can't grow forever
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS') or 2000)
+max_requests_jitter = 200
+
+accesslog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL') or 'info'
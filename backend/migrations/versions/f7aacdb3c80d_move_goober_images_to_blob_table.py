@@ -0,0 +1,76 @@
+"""move goober images to blob table
+
+Revision ID: f7aacdb3c80d
+Revises: d97d8659084c
+Create Date: 2026-10-18 16:10:56.096230
+
+"""
+import base64
+import hashlib
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f7aacdb3c80d'
+down_revision = 'd97d8659084c'
+branch_labels = None
+depends_on = None
+
+
+goobers = sa.table('goobers',
+    sa.column('id', sa.Integer()),
+    sa.column('image', sa.Text()),
+    sa.column('image_sha256', sa.Text()),
+)
+goober_images = sa.table('goober_images',
+    sa.column('sha256', sa.Text()),
+    sa.column('data', sa.LargeBinary()),
+)
+
+
+def upgrade():
+    op.create_table('goober_images',
+    sa.Column('sha256', sa.Text(), nullable=False),
+    sa.Column('data', sa.LargeBinary(), nullable=False),
+    sa.PrimaryKeyConstraint('sha256')
+    )
+    with op.batch_alter_table('goobers', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('image_sha256', sa.Text(), nullable=True))
+
+    # move each base64 image into goober_images as raw bytes, keyed by its sha256
+    connection = op.get_bind()
+    stored = set()
+    for goober_id, image in connection.execute(sa.select(goobers.c.id, goobers.c.image)).all():
+        data = base64.b64decode(image)
+        sha256 = hashlib.sha256(data).hexdigest()
+        if sha256 not in stored:
+            connection.execute(goober_images.insert().values(sha256=sha256, data=data))
+            stored.add(sha256)
+        connection.execute(goobers.update().where(goobers.c.id == goober_id).values(image_sha256=sha256))
+
+    with op.batch_alter_table('goobers', schema=None) as batch_op:
+        batch_op.alter_column('image_sha256', existing_type=sa.Text(), nullable=False)
+        batch_op.create_foreign_key('fk_goobers_image_sha256_goober_images', 'goober_images', ['image_sha256'], ['sha256'])
+        batch_op.drop_column('image')
+
+
+def downgrade():
+    with op.batch_alter_table('goobers', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('image', sa.TEXT(), nullable=True))
+
+    connection = op.get_bind()
+    rows = connection.execute(
+        sa.select(goobers.c.id, goober_images.c.data)
+        .select_from(goobers.join(goober_images, goobers.c.image_sha256 == goober_images.c.sha256))
+    ).all()
+    for goober_id, data in rows:
+        connection.execute(goobers.update().where(goobers.c.id == goober_id).values(image=base64.b64encode(data).decode('utf-8')))
+
+    with op.batch_alter_table('goobers', schema=None) as batch_op:
+        batch_op.alter_column('image', existing_type=sa.TEXT(), nullable=False)
+        batch_op.drop_constraint('fk_goobers_image_sha256_goober_images', type_='foreignkey')
+        batch_op.drop_column('image_sha256')
+
+    op.drop_table('goober_images')